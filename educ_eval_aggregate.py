@@ -0,0 +1,102 @@
+# Aggregation of evaluation scores for the education evaluation reports, 2026_10_17
+# Pieter Vreeburg, E:vreeburg@ese.eur.nl
+
+# Response weighted teacher and item scores (sum(score * respondents) / sum(respondents)) for all teachers at once, computed with NumPy group
+# reductions (np.bincount) over integer coded keys instead of chained pandas groupby / sum / divide steps.
+# Input is a long table with one row per teacher / course / item (and year for multi-year input, add the year column to the keys).
+# Used by educ_eval_indiv_report.py (2017) and educ_eval_indiv_report_2018.py.
+
+# Watch out for
+    # Teacher_score: all questions minus 'Has a good command of the English language'
+    # No course score is computed, the 2018 export has the course score per course as an item ('Course score', from 'Vakscore - gemiddelde')
+    # Respondents can be a range (eg '15-17' in the 2018 export, the number of respondents differs per item), the midpoint is used
+    # Rows without a (numeric) score: by default (count_missing_resp) their respondents are counted, as in the groupby / sum pipeline of the
+        # 2017 script (a missing score weighs as 0, a group with only missing scores gets score 0). With count_missing_resp = False they are
+        # skipped, also in the respondent totals, and groups without any score are dropped (used for the 2018 teacher statistics)
+    # Rows without respondents are skipped, groups without respondents are dropped
+
+# imports
+from collections import OrderedDict # ordered dictionary, from std. library
+
+import pandas as pd # dataframes functionality
+import numpy as np # group reductions
+
+# set items excluded from teacher scores
+english_item_pattern = r'good command of (?:the )?English language' # 2017: 'Has a good command of the English language', 2018: 'Good command of English language'
+
+# functions
+def resp_counts(resp_in):
+    # respondents as float array, ranges ('15-17') as their midpoint
+    if resp_in.dtype != object:
+        return pd.to_numeric(resp_in, errors = 'coerce').values.astype(float)
+    resp_range = resp_in.astype(unicode).str.split('-', expand = True)
+    resp_range = resp_range.apply(pd.to_numeric, errors = 'coerce')
+
+    return resp_range.mean(axis = 1).values
+
+def group_codes(df_in, key_columns):
+    # integer group code per row for the combinations of key_columns (-1 for rows with a missing key), and the key values per group code
+    # (sorted), groups are numbered with a dense lookup table if the number of possible key combinations is small, else with np.unique
+    column_codes = []
+    column_levels = []
+    for column in key_columns:
+        codes, levels = pd.factorize(df_in[column], sort = True)
+        column_codes.append(codes)
+        column_levels.append(levels)
+    shape = [max(len(levels), 1) for levels in column_levels]
+    key_space = reduce(lambda x, y: x * y, shape, 1)
+    has_key = np.ones(len(df_in), dtype = bool)
+    for codes in column_codes:
+        has_key &= codes >= 0
+    row_keys = np.ravel_multi_index([np.where(has_key, codes, 0) for codes in column_codes], shape) if len(df_in) else np.array([], dtype = int)
+    group_ids = np.full(len(df_in), -1, dtype = int)
+    if key_space <= 4 * len(df_in) + 1024:
+        unique_keys = np.flatnonzero(np.bincount(row_keys[has_key], minlength = key_space))
+        key_lookup = np.full(key_space, -1, dtype = int)
+        key_lookup[unique_keys] = np.arange(len(unique_keys))
+        group_ids[has_key] = key_lookup[row_keys[has_key]]
+    else:
+        unique_keys, group_ids[has_key] = np.unique(row_keys[has_key], return_inverse = True)
+    key_codes = np.unravel_index(unique_keys, shape)
+    keys = pd.DataFrame(OrderedDict((column, levels.take(codes)) for column, levels, codes in zip(key_columns, column_levels, key_codes)))
+
+    return group_ids, keys
+
+def weighted_scores(df_in, key_columns, score_column = 'score', resp_column = 'resp_count', count_missing_resp = True):
+    # response weighted score and total respondents per group of key_columns, indexed by key_columns (sorted ascending),
+    # groups without respondents are dropped
+    # count_missing_resp: respondents of rows without a score count in the totals (missing score weighs as 0, as the 2017 groupby pipeline)
+    group_ids, scores_out = group_codes(df_in, key_columns)
+    scores = pd.to_numeric(df_in[score_column], errors = 'coerce').values.astype(float)
+    resp = resp_counts(df_in[resp_column])
+    with np.errstate(invalid = 'ignore'): # nan respondents compare as False
+        with_resp = (group_ids >= 0) & (resp > 0)
+    valid = with_resp & ~np.isnan(scores)
+    counted = with_resp if count_missing_resp else valid
+    resp_total = np.bincount(group_ids[counted], weights = resp[counted], minlength = len(scores_out))
+    value_total = np.bincount(group_ids[valid], weights = scores[valid] * resp[valid], minlength = len(scores_out))
+    has_resp = resp_total > 0
+    scores_out = scores_out.loc[has_resp]
+    resp_total = resp_total[has_resp]
+    if np.array_equal(resp_total, np.round(resp_total)):
+        scores_out['resp_count'] = resp_total.astype(int)
+    else:
+        scores_out['resp_count'] = resp_total
+    scores_out['score'] = value_total[has_resp] / resp_total
+    scores_out = scores_out.set_index(key_columns)
+
+    return scores_out
+
+def teacher_scores(df_in, key_columns, item_column = 'item', exclude_items = (), score_column = 'score', resp_column = 'resp_count', count_missing_resp = True):
+    # teacher score per group of key_columns (eg ['teacher_erna', 'course_year']): all items minus the English language item and exclude_items
+    # the item filter is evaluated once per distinct item
+    item_codes, items = pd.factorize(df_in[item_column])
+    items = pd.Series(items).astype(unicode)
+    exclude = (items.str.contains(english_item_pattern, case = False) | items.isin(exclude_items)).values
+    keep = (item_codes >= 0) & ~exclude[item_codes]
+
+    return weighted_scores(df_in.loc[keep], key_columns, score_column, resp_column, count_missing_resp)
+
+def item_scores(df_in, key_columns, score_column = 'score', resp_column = 'resp_count', count_missing_resp = True):
+    # score per group of key_columns including the item column (eg ['teacher_erna', 'course_year', 'course_name', 'question_text'])
+    return weighted_scores(df_in, key_columns, score_column, resp_column, count_missing_resp)
@@ -0,0 +1,42 @@
+# Config file reader for the education evaluation reports, 2026_10_17
+# Pieter Vreeburg, E:vreeburg@ese.eur.nl
+
+# Dirs / files, wkhtmltopdf exe and options, output format and the address of the warm report server are set in
+# CONFIG_educ_eval_indiv_report.ini (next to the scripts, or the file in the EDUC_EVAL_CONFIG environment variable).
+# Only uses the std. library, so the CLI entry point can read the config without loading pandas.
+# Used by educ_eval_indiv_report_2018.py, educ_eval_indiv_report_server.py and educ_eval_indiv_report_cli.py.
+
+# Watch out for
+    # [pdfoptions]: cli switches without arguments (eg print-media-type) are listed without a value, comment out to switch off
+    # Values are read as is (no interpolation, no quotes), Windows paths do not need escaping
+
+# imports
+import os # os operations, from std. library
+import ConfigParser # ini file parser, from std. library
+from collections import OrderedDict # pdfoptions in file order, from std. library
+
+# set config file
+configfile = 'CONFIG_educ_eval_indiv_report.ini'
+path_options = ['main_dir', 'report_dir', 'inputfile', 'teacherfile', 'openquestionfile', 'cache_dir', 'store_dir', 'wkhtmltopdf_exe'] # required in [paths]
+
+# functions
+def config_path():
+    # config file in the EDUC_EVAL_CONFIG environment variable, or next to the scripts
+    return os.environ.get('EDUC_EVAL_CONFIG') or os.path.join(os.path.dirname(os.path.abspath(__file__)), configfile)
+
+def read_config(file_path = None):
+    # config as a flat dict: the [paths] options, output_format, pdfoptions (OrderedDict, switches: None), server_host and server_port
+    file_path = file_path or config_path()
+    parser = ConfigParser.RawConfigParser(allow_no_value = True)
+    if not parser.read(file_path):
+        raise IOError('Config file not found: {}'.format(file_path))
+    config = dict(parser.items('paths'))
+    missing_options = [option for option in path_options if option not in config]
+    if missing_options:
+        raise ValueError('Missing in [paths] of {}: {}'.format(file_path, ', '.join(missing_options)))
+    config['output_format'] = parser.get('report', 'output_format')
+    config['pdfoptions'] = OrderedDict(parser.items('pdfoptions'))
+    config['server_host'] = parser.get('server', 'host')
+    config['server_port'] = parser.getint('server', 'port')
+
+    return config
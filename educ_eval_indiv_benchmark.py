@@ -0,0 +1,158 @@
+# Script to benchmark educ_eval_indiv_report_2018.py on synthetic OWDB exports, 2026_10_17
+# Pieter Vreeburg, E:vreeburg@ese.eur.nl
+
+# For each size: generates export_teacher / export_open_questions files with the same columns as the 2018 OWDB exports and
+# a matching input file in a temporary directory, then runs the report script on it (all stages of main(), the data cache is built
+# in the first load) and collects the time of each stage. wkhtmltopdf is replaced by a stub that writes the HTML to the PDF path,
+# so the timings show the cost of the script itself. Results are written as JSON.
+
+# cli options
+    # --teachers N [N ...]: sizes to benchmark, number of teachers (default: 100 1000)
+    # --out: JSON results file (default: BENCHMARK_educ_eval_indiv_report.json)
+    # --seed: random seed for the synthetic exports (default: 2018)
+
+# imports
+import os # os operations, from std. library
+import sys # python version, from std. library
+import argparse # command line parsing, from std. library
+import tempfile # temporary dir for synthetic exports and reports, from std. library
+import shutil # remove temporary dir, from std. library
+import time # timing, from std. library
+import json # results file, from std. library
+
+import pandas as pd # dataframes functionality
+import numpy as np # random synthetic data
+
+import educ_eval_indiv_report_2018 as report # report script, run with its stage timings
+
+# set synthetic export layout (as export_teacher_2018.xlsx and export_open_questions_2018.xlsx)
+teacher_items = ['Explained the subject matter well',
+                'Motivated me to study the subject',
+                'Good command of English language',
+                'The explanations given were clear',
+                'Stimulated active participation',
+                'Provided sufficient assistance with assignments']
+question_texts = ['Wat heb je gewaardeerd in dit vak?',
+                'Welke suggesties heb je om dit vak te verbeteren?',
+                'Wil je nog iets anders kwijt over dit vak of de docenten?']
+answer_words = ['goede', 'uitleg', 'docent', 'duidelijk', 'tutorials', 'meer', 'voorbeelden', 'tempo', 'slides', 'opdrachten']
+
+# set up cli options parser
+opt_parser = argparse.ArgumentParser()
+opt_parser.add_argument('--teachers', help = 'Sizes to benchmark, number of teachers (default: 100 1000)', type = int, nargs = '+', default = [100, 1000])
+opt_parser.add_argument('--out', help = 'JSON results file (default: BENCHMARK_educ_eval_indiv_report.json)', default = 'BENCHMARK_educ_eval_indiv_report.json')
+opt_parser.add_argument('--seed', help = 'Random seed for the synthetic exports (default: 2018)', type = int, default = 2018)
+
+# functions
+def write_synthetic_exports(bench_dir, teacher_count, random):
+    # ~2 courses per teacher, ~1.5 teachers per course, ~15 open answers per course
+    course_count = max(1, teacher_count * 4 // 3)
+    course_codes = np.array(['FEB{:05d}'.format(course_nr) for course_nr in range(course_count)])
+    teacher_rows = []
+    input_lines = []
+    for teacher_nr in range(teacher_count):
+        sap_id = 10000 + teacher_nr
+        input_lines.append('{:05d};Teacher {};{}'.format(sap_id, teacher_nr, ['EC', 'BE', 'AE'][teacher_nr % 3]))
+        for course_code in random.choice(course_codes, random.randint(1, 4), replace = False):
+            scores = np.round(random.uniform(1, 5, len(teacher_items)), 2)
+            scores[random.rand(len(teacher_items)) < 0.3] = np.nan
+            teacher_rows.append(['{:05d}{}'.format(sap_id, 'abc'), 'Teacher {}'.format(teacher_nr), course_code, 'Course {}'.format(course_code),
+                                '2017-2018', random.choice(['C', 'W', 'P']), unicode(random.randint(5, 200))] +
+                                list(scores) + [round(random.uniform(5, 9), 2), round(random.uniform(1, 5), 2)])
+    teacher_columns = ['Teacher code', 'Teacher name', 'Course ID', 'Course name', 'Period', 'Education form', 'Respondents per teacher'] + \
+                    teacher_items + ['Vakscore - gemiddelde', 'Ik heb veel geleerd in dit vak']
+    pd.DataFrame(teacher_rows, columns = teacher_columns).to_excel(os.path.join(bench_dir, report.teacherfile), index = False)
+
+    answer_count = course_count * 15
+    df_open_answers = pd.DataFrame({'EVL_VAK' : random.choice(course_codes, answer_count),
+                                    'EVL_JAAR' : 2017,
+                                    'VRG_TEXT_NL' : random.choice(question_texts, answer_count),
+                                    'ROP_CONTENT' : [' '.join(random.choice(answer_words, random.randint(3, 30))) for answer_nr in range(answer_count)]
+                                    }, columns = ['EVL_VAK', 'EVL_JAAR', 'VRG_TEXT_NL', 'ROP_CONTENT'])
+    df_open_answers.to_excel(os.path.join(bench_dir, report.openquestionfile), index = False)
+
+    with open(os.path.join(bench_dir, report.inputfile), 'w') as f_out:
+        f_out.write('\n'.join(input_lines))
+
+    return len(teacher_rows), answer_count
+
+def stub_write_pdf(html_out, pdf_path, pdf_backend = 'wkhtmltopdf'):
+    # stand-in for wkhtmltopdf (replaces report.write_pdf): write the HTML to the PDF path
+    with open(pdf_path, 'wb') as f_out:
+        f_out.write(html_out.encode('utf-8'))
+
+def run_report(output_dir, args = None, input_lines = None):
+    # run the report script (report.run: all stages of main()) on the data in report.main_dir, with the reports, manifest, journal and logs
+    # in output_dir, output of the script is not printed. input_lines: teachers to report on (default: the input file in main_dir)
+    # returns stage_times (stage: [seconds]) and total wall time, raises RuntimeError if a PDF failed
+    patched = dict((name, os.path.join(output_dir, getattr(report, name))) for name in ['report_dir', 'manifestfile', 'journalfile', 'missingfile', 'failedfile'])
+    if input_lines is not None:
+        patched['inputfile'] = os.path.join(output_dir, report.inputfile)
+        with open(patched['inputfile'], 'w') as f_out:
+            f_out.write('\n'.join(input_lines))
+    os.mkdir(patched['report_dir'])
+    saved = dict((name, getattr(report, name)) for name in patched)
+    stdout = sys.stdout
+    report.stage_times.clear()
+    try:
+        for name, value in patched.items():
+            setattr(report, name, value)
+        sys.stdout = open(os.devnull, 'w')
+        start = time.time()
+        report.run(args or [])
+        total = time.time() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+        for name, value in saved.items():
+            setattr(report, name, value)
+    with open(patched['failedfile']) as f_in:
+        failed = f_in.read()
+    if failed:
+        raise RuntimeError('PDF output failed: {}'.format(failed))
+
+    return dict((stage, list(times)) for stage, times in report.stage_times.items()), total
+
+# main
+def main(options):
+    results = {'script_version' : report.script_version,
+            'python_version' : sys.version.split()[0],
+            'pandas_version' : pd.__version__,
+            'timestamp' : time.strftime('%Y-%m-%d %H:%M:%S'),
+            'runs' : []
+            }
+    random = np.random.RandomState(options.seed)
+    main_dir = report.main_dir
+    report.report_template() # the template is loaded from main_dir, load it before main_dir is switched to the benchmark dir
+    report.write_pdf = stub_write_pdf
+    report.pdf_retries = 0 # a failed PDF is not retried (the waits before a retry would be timed)
+    for teacher_count in options.teachers:
+        print 'benchmarking:', teacher_count, 'teachers'
+        bench_dir = tempfile.mkdtemp()
+        try:
+            teacher_rows, answer_rows = write_synthetic_exports(bench_dir, teacher_count, random)
+            report.main_dir = bench_dir
+            stage_times, total = run_report(bench_dir)
+        finally:
+            report.main_dir = main_dir
+            shutil.rmtree(bench_dir)
+        stage_times = dict((stage, sum(times)) for stage, times in stage_times.items())
+        results['runs'].append({'teachers' : teacher_count,
+                                'teacher_data_rows' : teacher_rows,
+                                'open_answer_rows' : answer_rows,
+                                'stages' : stage_times,
+                                'total' : total,
+                                'per_teacher' : total / teacher_count
+                                })
+        for stage, seconds in sorted(stage_times.items(), key = lambda item: -item[1]):
+            print '    {}: {:.3f} s'.format(stage, seconds)
+        print '    total: {:.3f} s'.format(total)
+
+    with open(options.out, 'w') as f_out:
+        json.dump(results, f_out, indent = 4, sort_keys = True)
+
+    print 'Done'
+
+if __name__ == '__main__':
+    options = opt_parser.parse_args()
+    main(options)
@@ -0,0 +1,47 @@
+# Script to compare the PDF backends of educ_eval_indiv_report_2018.py, 2026_10_17
+# Pieter Vreeburg, E:vreeburg@ese.eur.nl
+
+# Runs the report script (see educ_eval_indiv_benchmark.run_report) for the first teachers in the input file with each PDF backend and
+# prints the cost per report (render HTML + output PDF, data loading is not included). Output is written to a temporary directory
+# and removed afterwards.
+
+# cli options
+    # --teachers N: number of teachers to render with each backend, first N lines of the input file (default: 25)
+    # --backends: PDF backends to compare (default: wkhtmltopdf weasyprint)
+
+# imports
+import os # os operations, from std. library
+import argparse # command line parsing, from std. library
+import tempfile # temporary output dir, from std. library
+import shutil # remove temporary output dir, from std. library
+
+import educ_eval_indiv_report_2018 as report # report script, uses its dirs / files and pdfoptions
+import educ_eval_indiv_benchmark # run_report
+
+# set up cli options parser
+opt_parser = argparse.ArgumentParser()
+opt_parser.add_argument('--teachers', help = 'Number of teachers to render with each backend (default: 25)', type = int, default = 25)
+opt_parser.add_argument('--backends', help = 'PDF backends to compare (default: wkhtmltopdf weasyprint)', nargs = '+', choices = ['wkhtmltopdf', 'weasyprint'], default = ['wkhtmltopdf', 'weasyprint'])
+
+# main
+def main(options):
+    # run the report script for the first teachers in the input file with each backend
+    input_lines = open(os.path.join(report.main_dir, report.inputfile)).read().splitlines()[:options.teachers]
+    report.pdf_retries = 0 # a failed PDF is not retried (the waits before a retry would be timed as the cost of the backend)
+    results = []
+    for pdf_backend in options.backends:
+        output_dir = tempfile.mkdtemp()
+        try:
+            stage_times, total = educ_eval_indiv_benchmark.run_report(output_dir, ['--pdf-backend', pdf_backend], input_lines)
+        finally:
+            shutil.rmtree(output_dir)
+        report_count = len(stage_times.get('pdf_write', []))
+        results.append((pdf_backend, (sum(stage_times.get('template_render', [])) + sum(stage_times.get('pdf_write', []))) / max(report_count, 1)))
+
+    print 'reports per backend:', report_count
+    for pdf_backend, seconds in results:
+        print '{}: {:.3f} s per report ({:.0%} of {})'.format(pdf_backend, seconds, seconds / results[0][1], results[0][0])
+
+if __name__ == '__main__':
+    options = opt_parser.parse_args()
+    main(options)
@@ -0,0 +1,191 @@
+# Script to check the report HTML of educ_eval_indiv_report_2018.py against the BeautifulSoup rendering of v2018_8_27, 2026_10_17
+# Pieter Vreeburg, E:vreeburg@ese.eur.nl
+
+# Renders the reports of a fixed set of teachers (every n-th teacher in the teacher export) twice: with the current report functions
+# (html_table_out, course_feature macro, --nodata at render time) and as v2018_8_27 did (copied below): tables through the BeautifulSoup
+# round trip, open answers with the template loop of v2018_8_27 and nodata() applied to the finished page. The open answers section
+# cache (report.fragment_cache) is cleared before each current render, so every section is rendered for the teacher being checked.
+# Per teacher the current HTML is 'identical' to the v2018_8_27 HTML, differs only in whitespace ('whitespace', runs of whitespace
+# normalised to one space) or is 'different'. The --nodata HTML is compared with the v2018_8_27 --nodata HTML once parsed and
+# re-serialized with BeautifulSoup (the old nodata() did this to every page). Exit code 1 if a report is 'different' or if the results
+# or md5 hashes differ from CHECK_educ_eval_indiv_report_html.json (the expected output, in the same dir as this script).
+
+# Watch out for
+    # Requires bs4 and lxml (only for this check, the report script does not use them)
+    # The expected output belongs to the exports in main_dir (export_teacher_2018.xlsx / export_open_questions_2018.xlsx), refresh it with
+        # --write-expected after a deliberate change of the report HTML or new exports
+    # The teacher statistics table (added after v2018_8_27) is rendered with the v2018_8_27 html_table_out for the old page
+
+# cli options
+    # --write-expected: write the results as the new expected output instead of comparing
+    # --teachers N: number of teachers in the fixed set (default: 25)
+
+# imports
+import os # os operations, from std. library
+import sys # exit code, from std. library
+import argparse # command line parsing, from std. library
+import json # expected output, from std. library
+import hashlib # md5 of the HTML, from std. library
+import re # whitespace normalisation, from std. library
+
+from bs4 import BeautifulSoup # HTML parser, as used by v2018_8_27
+
+import educ_eval_indiv_report_2018 as report # report script, data loading, template vars and template
+import educ_eval_teacher_index # teacher to row offsets index
+
+# set check options
+expectedfile = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'CHECK_educ_eval_indiv_report_html.json')
+features_loop = '''            {% for course_feature in courses_features %}
+                {{ course_feature }}
+            {% endfor %}''' # open answers loop of the current template, replaced by features_loop_2018_8_27 for the old page
+features_loop_2018_8_27 = '''            {% for course_feature in courses_features %}
+                {% if course_feature.1 %}
+                    <h3><a id = '{{ course_feature.0 }}'>{{ course_feature.0 }}</a></h3>
+                    {% for question_text, question_answers in course_feature.1.iteritems() %}
+                        <h4>{{ question_text }}</h4>
+                        <table id = 'box-table-a'>
+                            <tbody>
+                            {% for item in question_answers %}
+                                <tr><td>{{ item }}</td></tr>
+                            {% endfor %}
+                            </tbody>
+                        </table>
+                    {% endfor %}
+                {% endif %}
+            {% endfor %}''' # open answers loop of the v2018_8_27 template
+
+# set up cli options parser
+opt_parser = argparse.ArgumentParser()
+opt_parser.add_argument('--write-expected', help = 'Write the results as the new expected output', action = 'store_true')
+opt_parser.add_argument('--teachers', help = 'Number of teachers in the fixed set (default: 25)', type = int, default = 25)
+
+# functions
+def html_table_out_2018_8_27(dataframe_in, table_id, del_header = None):
+    # html_table_out of v2018_8_27
+    if del_header == 'del_header':
+        html = dataframe_in.to_html(index = False, header = False)
+    else:
+        html = dataframe_in.to_html()
+    soup = BeautifulSoup(html, 'lxml')
+    soup.find('table')['id'] = table_id
+    del soup.table['border']
+    html_out = unicode(str(soup), 'utf-8')
+
+    return html_out
+
+def nodata_2018_8_27(html_in):
+    # nodata of v2018_8_27: all td tags of the finished report as XXX
+    soup = BeautifulSoup(html_in, 'lxml')
+    td_tags = soup.find_all('td')
+    for tag in td_tags:
+        tag.string = 'XXX'
+    html_out = unicode(str(soup), 'utf-8')
+
+    return html_out
+
+def template_2018_8_27():
+    # current template file with the open answers loop of v2018_8_27 (the rest of the page is unchanged since v2018_8_27)
+    template = report.report_template()
+    with open(template.filename) as f_in:
+        source = f_in.read().decode('utf-8')
+    if features_loop not in source:
+        raise ValueError('Open answers loop not found in {}, update features_loop'.format(template.filename))
+
+    return template.environment.from_string(source.replace(features_loop, features_loop_2018_8_27))
+
+def render(teacher_erna_id, courses_details_rep, teacher_stats_rep, open_answers_index, nodata_flag):
+    # report HTML of one teacher with the current report functions, open answers sections rendered for this teacher
+    report.fragment_cache.clear()
+    template_vars = report.report_template_vars(teacher_erna_id, 'Teacher {}'.format(teacher_erna_id), courses_details_rep, open_answers_index, nodata_flag, teacher_stats_rep)
+
+    return report.report_template().render(template_vars)
+
+def render_2018_8_27(template, teacher_erna_id, courses_details_rep, teacher_stats_rep, open_answers_index):
+    # report HTML of one teacher as v2018_8_27 rendered it (without --nodata)
+    # Format courses_open_answers: [[str_course_name', {str_question_text: [list_open_questions_answers]}], etc.]
+    courses_taught = courses_details_rep.xs(['course_code', 'course_name'], axis = 1).drop_duplicates()
+    courses_index = []
+    courses_open_answers = []
+    for index, row in courses_taught.iterrows():
+        if row['course_code'] not in open_answers_index:
+            continue
+        courses_index.append(row['course_name'])
+        courses_open_answers.append([row['course_name'], open_answers_index[row['course_code']]])
+    courses_details_rep = courses_details_rep.rename(columns = {'course_code' : 'Course code',
+                                                                'course_name' : 'Course name',
+                                                                'educ_form' : 'Education form',
+                                                                'resp_count' : '# Respondents',
+                                                                'item' : 'Item',
+                                                                'score' : 'Score'})
+    courses_details_rep = courses_details_rep.set_index(['Course code', 'Course name', 'Education form', '# Respondents', 'Item'])
+    template_vars = {'name' : 'Teacher {}'.format(teacher_erna_id),
+                    'erna' : teacher_erna_id,
+                    'teacher_statistics' : html_table_out_2018_8_27(teacher_stats_rep, 'one-column-emphasis-teacher') if len(teacher_stats_rep) else '',
+                    'courses_details' : html_table_out_2018_8_27(courses_details_rep, 'one-column-emphasis'),
+                    'courses_index' : courses_index,
+                    'courses_features' : courses_open_answers
+                    }
+
+    return template.render(template_vars)
+
+def compare(html, html_old):
+    # 'identical', 'whitespace' (identical after normalising runs of whitespace to one space) or 'different'
+    if html == html_old:
+        return 'identical'
+    if re.sub(r'\s+', ' ', html).strip() == re.sub(r'\s+', ' ', html_old).strip():
+        return 'whitespace'
+
+    return 'different'
+
+def md5(html):
+    return hashlib.md5(html.encode('utf-8')).hexdigest()
+
+# main
+def main(options):
+    df_teacher_data, df_open_answers, courses_details = report.load_data_cached()
+    open_answers_index = report.group_open_answers(df_open_answers)
+    teacher_stats = report.teacher_statistics(courses_details)
+    courses_details, courses_offsets = educ_eval_teacher_index.teacher_index(courses_details)
+    teacher_stats, teacher_stats_offsets = educ_eval_teacher_index.teacher_index(teacher_stats)
+    erna_ids = sorted(courses_offsets)
+    check_ids = erna_ids[::max(1, len(erna_ids) // options.teachers)][:options.teachers]
+    template_old = template_2018_8_27()
+
+    results = {}
+    for erna_id in check_ids:
+        teacher_erna_id = '{:05d}'.format(erna_id)
+        courses_details_rep = educ_eval_teacher_index.teacher_rows(courses_details, courses_offsets, erna_id)
+        teacher_stats_rep = educ_eval_teacher_index.teacher_rows(teacher_stats, teacher_stats_offsets, erna_id)
+        html = render(teacher_erna_id, courses_details_rep, teacher_stats_rep, open_answers_index, False)
+        html_nodata = render(teacher_erna_id, courses_details_rep, teacher_stats_rep, open_answers_index, True)
+        html_old = render_2018_8_27(template_old, teacher_erna_id, courses_details_rep, teacher_stats_rep, open_answers_index)
+        results[teacher_erna_id] = {'html' : compare(html, html_old),
+                                    'nodata_after_reparse' : compare(unicode(str(BeautifulSoup(html_nodata, 'lxml')), 'utf-8'), nodata_2018_8_27(html_old)),
+                                    'html_md5' : md5(html),
+                                    'nodata_md5' : md5(html_nodata)
+                                    }
+    report.fragment_cache.clear()
+
+    count_old = sum(1 for result in results.values() if 'different' in (result['html'], result['nodata_after_reparse']))
+    if options.write_expected:
+        if count_old:
+            print 'expected output not written: {} teachers different from v2018_8_27'.format(count_old)
+            return 1
+        with open(expectedfile, 'w') as f_out:
+            json.dump(results, f_out, indent = 4, sort_keys = True, separators = (',', ': '))
+        print 'expected output written: {} teachers'.format(len(results))
+        return 0
+    with open(expectedfile) as f_in:
+        expected = json.load(f_in)
+    count_failed = 0
+    for teacher_erna_id in sorted(set(expected) | set(results)):
+        if results.get(teacher_erna_id) != expected.get(teacher_erna_id) or 'different' in results.get(teacher_erna_id, {}).values():
+            print 'different: {} (expected: {}, now: {})'.format(teacher_erna_id, expected.get(teacher_erna_id), results.get(teacher_erna_id))
+            count_failed += 1
+    print 'teachers checked: {}, different from v2018_8_27: {}, different from expected output: {}'.format(len(results), count_old, count_failed)
+
+    return 1 if count_failed else 0
+
+if __name__ == '__main__':
+    options = opt_parser.parse_args()
+    sys.exit(main(options))
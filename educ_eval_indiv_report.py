@@ -29,6 +29,9 @@ from bs4 import BeautifulSoup # HTML parser, used to add CSS ID to HTML tables
 from jinja2 import Environment, FileSystemLoader # templating engine
 import pdfkit # to Py wrapper for wkhtmltopdf.exe
 
+import educ_eval_aggregate # response weighted teacher / item scores
+import educ_eval_teacher_index # teacher to row offsets index, ERNA-id normalisation
+
 # set dirs / files
 inputfile = 'INPUT_educ_eval_indiv_report_py.txt'
 sourcefile = 'educ_eval_indiv_report_data_2015_2016.xlsx'
@@ -94,6 +97,7 @@ def main(options):
                                                          'Total' : 'resp_count',
                                                          'AMC_ORDERID' : 'resp_value',
                                                          'Lange naam' : 'course_name'})
+    df_teacher_data['teacher_erna'] = educ_eval_teacher_index.normalise_erna(df_teacher_data['teacher_erna'])
     df_teacher_data = df_teacher_data.sort_values(['teacher_erna', 'course_year', 'course_name', 'question_text'], ascending = [True, False, True, True])
     df_open_answers = pd.read_excel(os.path.join(main_dir, sourcefile), sheetname = 1)
     df_open_answers = df_open_answers.rename(columns = {'EVL_SIN_ID' : 'sin_id',
@@ -101,44 +105,42 @@ def main(options):
                                                          'ROP_CONTENT' : 'resp_value'})
     df_open_answers = df_open_answers.sort_values(['sin_id', 'question_text'])
 
-    # add calculated total_value to df_teacher_data
-    df_teacher_data['total_value'] = df_teacher_data['resp_value'] * df_teacher_data['resp_count']
-
-    # create teacher stats pivot
-    teacher_stats = df_teacher_data[~df_teacher_data['question_text'].str.contains('good command of the English language')]
-    teacher_stats = teacher_stats.groupby(['teacher_erna', 'course_year'])[['resp_count', 'total_value']].sum()
-    teacher_stats['teacher_score'] = teacher_stats['total_value'] / teacher_stats['resp_count']
-    teacher_stats = teacher_stats.dropna().round(2)
-    teacher_stats = teacher_stats.drop(['total_value', 'resp_count'], axis = 1)
+    # create teacher stats pivot (response weighted, see educ_eval_aggregate)
+    teacher_stats = educ_eval_aggregate.teacher_scores(df_teacher_data, ['teacher_erna', 'course_year'], item_column = 'question_text', score_column = 'resp_value')
+    teacher_stats = teacher_stats.round(2)
+    teacher_stats = teacher_stats.drop('resp_count', axis = 1)
     teacher_stats = teacher_stats.sort_index(ascending = False)
-    teacher_stats = teacher_stats.rename_axis(['erna id', 'year']).rename(columns = {'teacher_score' : 'teacher score'})
+    teacher_stats = teacher_stats.rename_axis(['erna id', 'year']).rename(columns = {'score' : 'teacher score'})
 
-    # create courses details pivot
-    courses_details = df_teacher_data.groupby(['teacher_erna', 'course_year', 'course_name', 'question_text'])[['resp_count', 'total_value']].sum()
-    courses_details['teacher_score'] = courses_details['total_value'] / courses_details['resp_count']
-    courses_details = courses_details.dropna().round(2)
-    courses_details = courses_details.drop('total_value', axis = 1)
+    # create courses details pivot (response weighted, see educ_eval_aggregate)
+    courses_details = educ_eval_aggregate.item_scores(df_teacher_data, ['teacher_erna', 'course_year', 'course_name', 'question_text'], score_column = 'resp_value')
+    courses_details = courses_details.round(2)
     courses_details = courses_details.sort_index(level = ['teacher_erna', 'course_year', 'course_name', 'question_text'], ascending = [True, False, True, True])
         # Broken implementation in pandas 0.2, wil be fixed in 0.21 (https://github.com/pandas-dev/pandas/issues/16934)
-    courses_details = courses_details.rename_axis(['erna id', 'year', 'course', 'question']).rename(columns = {'resp_count' : 'respondents', 'teacher_score' : 'teacher score'})
+    courses_details = courses_details.rename_axis(['erna id', 'year', 'course', 'question']).rename(columns = {'resp_count' : 'respondents', 'score' : 'teacher score'})
+
+    # index teachers (row offsets per teacher, see educ_eval_teacher_index)
+    teacher_stats, teacher_stats_offsets = educ_eval_teacher_index.teacher_index(teacher_stats)
+    courses_details, courses_details_offsets = educ_eval_teacher_index.teacher_index(courses_details)
+    df_teacher_data, teacher_data_offsets = educ_eval_teacher_index.teacher_index(df_teacher_data, 'teacher_erna')
+
+    # read input file, teachers without teacher stats are logged as missing
+    input_file = [line.split(';') for line in open(os.path.join(main_dir, inputfile)).read().splitlines()]
+    input_erna = educ_eval_teacher_index.normalise_erna([input_erna_id for input_erna_id, pers_name, dept, pers_type in input_file])
+    input_missing = educ_eval_teacher_index.missing_teachers(input_erna, teacher_stats_offsets)
+    list_missing = ['{}; {}; {}'.format(teacher_erna_id, pers_name, dept) for (input_erna_id, pers_name, dept, pers_type), teacher_erna_id, missing in zip(input_file, input_erna, input_missing) if missing]
 
     # iterate through input file, find course stats, course details and open answers to create individual reports
-    input_file = open(os.path.join(main_dir, inputfile)).read().splitlines()
-    list_missing = []
-    for line in input_file:
-        teacher_erna_id, pers_name, dept, pers_type = line.split(';')
-        teacher_erna_id = int(teacher_erna_id)
+    for (input_erna_id, pers_name, dept, pers_type), teacher_erna_id, missing in zip(input_file, input_erna, input_missing):
+        if missing:
+            continue
         print 'processing:', teacher_erna_id
         # teacher stats & courses details
-        try:
-            teacher_stats_rep = teacher_stats.xs(teacher_erna_id, level = 0)
-        except KeyError:
-            list_missing.append('{}; {}; {}'.format(teacher_erna_id, pers_name, dept))
-            continue
-        courses_details_rep = courses_details.xs(teacher_erna_id, level = 0)
+        teacher_stats_rep = educ_eval_teacher_index.teacher_rows(teacher_stats, teacher_stats_offsets, teacher_erna_id, drop_level = True)
+        courses_details_rep = educ_eval_teacher_index.teacher_rows(courses_details, courses_details_offsets, teacher_erna_id, drop_level = True)
         # open questions
         # Format courses_open_answers: [[str_course_year, str_course_name', {str_question_text: [list_open_questions_answers]}], etc.]
-        courses_taught = df_teacher_data.loc[(df_teacher_data['teacher_erna'] == teacher_erna_id), ['sin_id', 'course_name', 'course_year']].drop_duplicates()
+        courses_taught = educ_eval_teacher_index.teacher_rows(df_teacher_data, teacher_data_offsets, teacher_erna_id)[['sin_id', 'course_name', 'course_year']].drop_duplicates()
         courses_index = OrderedDict()
         courses_open_answers = []
         for index, row in courses_taught.iterrows():
@@ -5,8 +5,13 @@
     # The available data is not consistent with regards to ERNA-ids. Sometimes only SAP-id is used (eg 6610),
         # sometimes the full ERNA-id is used (eg 06610pfr) (Use Excel to trim full ERNA-id to SAP-id: =INT(LEFT(A2;5)) )
     # The answer-values can span 1:6 instead of 1:5. 6 is Na. Filter this in the source data (not provisioned for in this script)
-    # The selected output format (for stand-alone use or as part of the RO pipeline: use the output_format variable to set the output format)
-    # Teacher_score: all questions minus 'Has a good command of the English language'
+    # The selected output format (for stand-alone use or as part of the RO pipeline: use output_format in the config file to set the output format)
+    # Dirs / files, wkhtmltopdf exe and pdfoptions are set in CONFIG_educ_eval_indiv_report.ini (see educ_eval_config)
+    # Teacher_score: all questions minus 'Has a good command of the English language' (and minus the course items in course_items)
+    # Respondents per teacher can be a range (eg 15-17), for the teacher score the midpoint is used
+    # --stream-open-answers with an xlsx export saved by Excel: the whole shared strings table is loaded (see read_xlsx_rows),
+        # so the texts of all answers (also of open questions not used in the report) are in memory. Export large files as csv (UTF-8)
+        # for streaming with a peak memory that only depends on the answers kept
 # v2018
     # GENERAL: Add course scores
     # GENERAL: Add course code (easier to verify reports)
@@ -16,77 +21,464 @@
     # PHF: Experiment with ML / Sentiment analysis approach to open questions (Consult Frasincar / Glorie) Maybe use for final assignment EQI?
     
 # cli options
-    # --nodata: strip all data from the html file just before printing
+    # --nodata: represent all data cells in the report as XXX
+    # --workers N: render and print the reports in a pool of N processes (default: 1, serial)
+    # --rebuild-cache: re-read the Excel source files and rebuild the data cache
+    # --incremental: only output reports that changed since the previous run, remove reports of teachers no longer reported on
+    # --pdf-backend weasyprint: output PDF in-process with WeasyPrint instead of one wkhtmltopdf process per report
+    # --stream-open-answers: read the open questions export row by row (xlsx or csv), keeping only the open questions used in the report
+        # (use csv for large exports, see Watch out for)
+    # --timings FILE: write wall time and increase of the peak memory per stage, peak memory of the run and p50 / p95 per teacher to FILE (JSON)
+    # --profile [FILE]: run with cProfile and dump the stats to FILE (default: PROFILE_educ_eval_indiv_report.prof)
+    # --ingest YEAR: add the teacher export to the multi-year store as YEAR (replaces YEAR if already in the store) and exit, requires pyarrow
+    # --history [YEAR ...]: add a table with the teacher score per year from the multi-year store (default: all years in the store)
+    # --sentiment: add answers, sentiment, share of positive / negative answers and top terms to the open answers of each course
+        # (lexicon based, see educ_eval_sentiment, scores are cached per answer in the cache dir)
+    # --output staging: write the reports to a local staging dir and copy them to report_dir in one pass at the end of the run
+    # --output zip: write the reports into one ZIP archive per department ('stand_alone') or per run, with a manifest (see educ_eval_output)
+    # --html: also output the HTML of each report (next to the PDF)
+    # --max-inflight N: with --workers, at most N reports assembled and waiting for a worker (default: 2 x workers), limits memory use
+    # --resume: continue an interrupted run, skip the teachers marked as done in the journal of that run (only with --output files)
+        # (the journal records each teacher as done, failed or missing as soon as it finishes, a failed PDF is retried pdf_retries times)
 
 # imports
 import os # os operations, from std. library
 import argparse # command line parsing, from std. library
-from collections import OrderedDict # ordered dictionary, from std. library
+import json # cache metadata, from std. library
+import hashlib # cache keys, from std. library
+import csv # streaming reader for csv exports, from std. library
+import zipfile # streaming reader for xlsx exports, from std. library
+import posixpath # part paths in xlsx exports, from std. library
+import xml.etree.cElementTree as ElementTree # streaming reader for xlsx exports, from std. library
+import time # stage timings and footer date for WeasyPrint, from std. library
+import cProfile # --profile, from std. library
+from contextlib import contextmanager # stage timer, from std. library
+import re # unescaping xlsx text and HTML table clean up, from std. library
+import multiprocessing # process pool for parallel PDF output, from std. library
+import shutil # remove staging dir, from std. library
+from collections import OrderedDict, deque # ordered dictionary, queue of reports in the process pool, from std. library
+try:
+    import resource # peak memory (Unix), from std. library
+except ImportError:
+    resource = None
 
 import pandas as pd # dataframes functionality
 import numpy as np # numeric functions for use in pandas
-from bs4 import BeautifulSoup # HTML parser, used to add CSS ID to HTML tables
-from jinja2 import Environment, FileSystemLoader # templating engine
-import pdfkit # to Py wrapper for wkhtmltopdf.exe
-
-# set dirs / files
-inputfile = 'INPUT_educ_eval_indiv_report_py.txt'
-teacherfile = 'export_teacher_2018.xlsx'
-openquestionfile = 'export_open_questions_2018.xlsx'
-main_dir = r'C:\git_repos\educ_eval_indiv'
-report_dir = 'reports'
-wkhtmltopdf_exe = r'\\campus.eur.nl\users\home\50389pvr\Documents\no-app-control\bin\wkhtmltopdf.exe'
+# jinja2 (templating engine) and pdfkit (to Py wrapper for wkhtmltopdf.exe) are imported on first use, see report_template and write_pdf
+
+import educ_eval_config # config file (dirs / files, pdfoptions, output format)
+import educ_eval_aggregate # response weighted teacher scores
+import educ_eval_teacher_index # teacher to row offsets index, ERNA-id normalisation
+import educ_eval_store # multi-year store, partitioned by year
+import educ_eval_sentiment # lexicon based sentiment and top terms of the open answers
+import educ_eval_output # staging dir and ZIP archive output
+
+# set dirs / files (see CONFIG_educ_eval_indiv_report.ini)
+config = educ_eval_config.read_config()
+inputfile = config['inputfile']
+teacherfile = config['teacherfile']
+openquestionfile = config['openquestionfile']
+main_dir = config['main_dir']
+report_dir = config['report_dir']
+cache_dir = config['cache_dir'] # cleaned source data in Parquet format (requires pyarrow)
+store_dir = config['store_dir'] # courses details of all ingested years, partitioned by year (requires pyarrow, see educ_eval_store)
+templatefile = 'educ_eval_indiv_report_template_2018.html' # in main_dir
+sentimentfile = 'sentiment_scores.json' # sentiment and terms per answer (md5 hash), in cache_dir
+manifestfile = 'MANIFEST_educ_eval_indiv_report{}.json' # content hash and output file per teacher of the previous run, separate files with and without --nodata
+journalfile = 'JOURNAL_educ_eval_indiv_report{}.jsonl' # status per teacher of the current run (done / failed / missing), one JSON line per teacher, used by --resume
+missingfile = 'LOG_missing_educ_eval_indiv_report.txt'
+failedfile = 'LOG_failed_educ_eval_indiv_report.txt'
+wkhtmltopdf_exe = config['wkhtmltopdf_exe']
 
 # set global options
 pd.set_option('display.max_colwidth', -1) # Pandas, no truncation of values
-env = Environment(loader = FileSystemLoader(main_dir)) # Jinja
-template = env.get_template('educ_eval_indiv_report_template_2018.html') # Jinja
-pdfoptions = { # wkhtmltopdf
-                'print-media-type' : None, # cli switch without arguments, comment out to switch to screen-media-type
-                'page-size' : 'A4',
-                'margin-top': '10mm',
-                'margin-right': '10mm',
-                'margin-bottom': '10mm',
-                'margin-left': '10mm',
-                'footer-right' : 'Page [page] of [toPage]',
-                'footer-left' : 'Report generated on: [date]',
-                'footer-font-name' : 'sans-serif', # default Arial
-                'footer-font-size' : '8', # default 12
-                'quiet': None # cli switch without arguments, comment out to switch to verbose mode
-                }
-pdfconfiguration = pdfkit.configuration(wkhtmltopdf = wkhtmltopdf_exe)
-output_format = 'ro' # switch between 'ro', 'stand_alone' or 'stand_alone_flat' (with the last option files are not sorted into subfolders)
+template = None # Jinja template, loaded on first use, see report_template
+pdfoptions = config['pdfoptions'] # wkhtmltopdf, see [pdfoptions] in the config file
+pdfconfiguration = None # wkhtmltopdf exe for pdfkit, set up on first use, see write_pdf
+weasyprint_css = None # @page stylesheet for --pdf-backend weasyprint, see weasyprint_stylesheet
+stage_times = {} # wall time per call for each stage (stage: [seconds]), see stage_timer
+record_timings = True # switched off in long running processes (report server), stage_times keeps every call
+stage_memory = {} # increase of the peak memory (high-water mark, MB) of the process during each stage, summed over all calls
+fragment_cache = {} # rendered open answers section per course, (course_code, course_name, nodata, summary, data version): HTML, see course_feature_html
+fragment_counts = {'hits' : 0, 'misses' : 0}
+fragment_uses = {} # teachers still to be assembled per course code in this run, a course's sections are dropped after its last teacher (see release_fragments)
+script_version = '2018_8_27.1' # part of the cache key, change after changing the data cleaning steps in load_data
+cache_frames = ['df_teacher_data', 'df_open_answers', 'courses_details']
+open_questions = OrderedDict([('Wat heb je gewaardeerd in dit vak?', 'What did you appreciate in this course?'), # open questions used in the report (VRG_TEXT_NL: English text)
+                            ('Welke suggesties heb je om dit vak te verbeteren?', 'Which suggestions do you have to improve this course?')])
+open_answer_columns = ['EVL_VAK', 'VRG_TEXT_NL', 'ROP_CONTENT'] # columns used from the open questions export
+na_values = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', 'N/A', 'NA', 'NULL', 'NaN', 'n/a', 'nan', 'null'] # read as NaN, as in pd.read_excel
+course_items = ['Course score', 'I learned much in this course'] # items about the course, not included in the teacher score
+sort_list = ['What did you appreciate in this course?', # order of the open questions in the report
+            'Which suggestions do you have to improve this course?']
+mixed_suffix = '__text' # cache column suffix for the text values of mixed text / number columns
+xlsx_ns = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}' # xlsx worksheet / shared strings elements, see read_xlsx_rows
+xlsx_relation_id = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id'
+xml_space = '{http://www.w3.org/XML/1998/namespace}space'
+pdf_retries = 2 # retries of a failed PDF output (eg a crashed wkhtmltopdf process), the teacher is logged as failed after the last retry
+retry_delay = 2 # seconds before the first retry, doubled for each next retry
+output_format = config['output_format'] # switch between 'ro', 'stand_alone' or 'stand_alone_flat' (with the last option files are not sorted into subfolders)
 
 # set up cli options parser
 opt_parser = argparse.ArgumentParser()
 opt_parser.add_argument('--nodata', help = 'Produce reports with data cells represented as XXX', action = 'store_true')
-options = opt_parser.parse_args()
+opt_parser.add_argument('--workers', help = 'Number of processes used to render and print the reports (default: 1)', type = int, default = 1)
+opt_parser.add_argument('--rebuild-cache', help = 'Re-read the Excel source files and rebuild the data cache', action = 'store_true')
+opt_parser.add_argument('--incremental', help = 'Only output reports that changed since the previous run', action = 'store_true')
+opt_parser.add_argument('--pdf-backend', help = 'Engine used to output PDF (default: wkhtmltopdf)', choices = ['wkhtmltopdf', 'weasyprint'], default = 'wkhtmltopdf')
+opt_parser.add_argument('--stream-open-answers', help = 'Read the open questions export row by row to limit memory use', action = 'store_true')
+opt_parser.add_argument('--timings', help = 'Write wall time and peak memory per stage to this JSON file')
+opt_parser.add_argument('--profile', help = 'Run with cProfile and dump the stats to this file', nargs = '?', const = 'PROFILE_educ_eval_indiv_report.prof')
+opt_parser.add_argument('--sentiment', help = 'Add sentiment and top terms of the open answers per course', action = 'store_true')
+opt_parser.add_argument('--output', help = 'Write reports to report_dir directly (files), via a local staging dir or into ZIP archives (default: files)', choices = ['files', 'staging', 'zip'], default = 'files')
+opt_parser.add_argument('--html', help = 'Also output the HTML of each report', action = 'store_true')
+opt_parser.add_argument('--max-inflight', help = 'With --workers, number of reports waiting for a worker (default: 2 x workers)', type = int)
+opt_parser.add_argument('--resume', help = 'Continue an interrupted run, skip the teachers done in that run', action = 'store_true')
+opt_parser.add_argument('--ingest', help = 'Add the teacher export to the multi-year store as this year and exit', type = int, metavar = 'YEAR')
+opt_parser.add_argument('--history', help = 'Add the teacher score per year from the multi-year store (default: all years)', type = int, nargs = '*', metavar = 'YEAR')
 
 # functions
-def html_table_out(dataframe_in, table_id, del_header = None):
+def peak_memory_mb():
+    # peak memory of this process in MB, None if not available (Windows without psutil)
+    if resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0 # kB on Linux
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().peak_wset / 1024.0 ** 2
+
+@contextmanager
+def stage_timer(stage):
+    # record wall time and the increase of the peak memory of the process during a stage in stage_times / stage_memory (if record_timings)
+    # the peak memory never goes down, a stage that uses less memory than an earlier stage adds 0
+    if not record_timings:
+        yield
+        return
+    start = time.time()
+    peak_start = peak_memory_mb()
+    try:
+        yield
+    finally:
+        stage_times.setdefault(stage, []).append(time.time() - start)
+        if peak_start is not None:
+            stage_memory[stage] = stage_memory.get(stage, 0.0) + peak_memory_mb() - peak_start
+
+def timings_summary(teacher_times, total_time):
+    # totals and p50 / p95 per stage, p50 / p95 of the time spent per teacher
+    summary = {'total' : total_time, 'peak_memory_mb' : peak_memory_mb(), 'stages' : {}, 'per_teacher' : {}, 'fragment_cache' : dict(fragment_counts)}
+    for stage, times in stage_times.items():
+        summary['stages'][stage] = {'count' : len(times),
+                                    'total' : sum(times),
+                                    'p50' : np.percentile(times, 50),
+                                    'p95' : np.percentile(times, 95),
+                                    'peak_memory_increase_mb' : stage_memory.get(stage)
+                                    }
+    if teacher_times:
+        summary['per_teacher'] = {'count' : len(teacher_times),
+                                'p50' : np.percentile(teacher_times.values(), 50),
+                                'p95' : np.percentile(teacher_times.values(), 95),
+                                'slowest' : max(teacher_times, key = teacher_times.get)
+                                }
+
+    return summary
+
+def html_table_out(dataframe_in, table_id, del_header = None, nodata_flag = False):
+    # render dataframe as HTML table with CSS id table_id (no border attribute, no indentation, wrapped in html / body tags as in earlier versions)
+    # with nodata_flag all data cells are represented as XXX
+    if nodata_flag:
+        dataframe_in = pd.DataFrame('XXX', index = dataframe_in.index, columns = dataframe_in.columns)
     if del_header == 'del_header':
-        html = dataframe_in.to_html(index = False, header = False)
+        html = dataframe_in.to_html(index = False, header = False, table_id = table_id)
     else:
-        html = dataframe_in.to_html()
-    soup = BeautifulSoup(html, 'lxml')
-    soup.find('table')['id'] = table_id
-    del soup.table['border']
-    html_out = unicode(str(soup), 'utf-8')
+        html = dataframe_in.to_html(table_id = table_id)
+    html = html.replace('<table border="1" ', '<table ', 1)
+    html = re.sub(r'\n +', '\n', html)
+    html_out = u'<html><body>{}</body></html>'.format(html)
 
     return html_out
 
-def nodata(html_in):
-    soup = BeautifulSoup(html_in, 'lxml')
-    td_tags = soup.find_all('td')
-    for tag in td_tags:
-        tag.string = 'XXX'
-    html_out = unicode(str(soup), 'utf-8')
+def course_feature_html(course_code, course_name, open_answers, nodata_flag = False, course_summary = None, data_version = None):
+    # open answers section of one course (course_feature macro in the template), rendered once and reused for all teachers of the course
+    # course_summary: sentiment and top terms of the course (with --sentiment, see educ_eval_sentiment)
+    # data_version: part of the key when the open answers can change while the process runs (report server reloads), last item of the key
+    fragment_key = (course_code, course_name, nodata_flag, course_summary is not None, data_version)
+    if fragment_key in fragment_cache:
+        fragment_counts['hits'] += 1
+    else:
+        fragment_counts['misses'] += 1
+        fragment_cache[fragment_key] = unicode(report_template().module.course_feature(course_name, open_answers, nodata_flag, course_summary))
 
-    return html_out
+    return fragment_cache[fragment_key]
 
-# main
-def main(options):
-    # read Excel source file
+def course_uses(courses_details, input_teachers):
+    # number of teachers in input_teachers (in input order, a teacher listed twice counts twice) per course code in courses_details
+    # (indexed by teacher), known before the report loop so fragment_cache can drop a course after its last teacher
+    teacher_courses = pd.DataFrame({'erna_id' : courses_details.index.values, 'course_code' : courses_details['course_code'].values}).drop_duplicates()
+    input_counts = pd.Series([erna_id for teacher_erna_id, pers_name, dept, erna_id in input_teachers]).value_counts()
+    teacher_courses['uses'] = teacher_courses['erna_id'].map(input_counts).fillna(0).astype(int)
+    uses = teacher_courses.groupby('course_code')['uses'].sum()
+
+    return uses[uses > 0].to_dict()
+
+def release_fragments(course_codes):
+    # one teacher of course_codes is assembled: drop the open answers sections of the courses without teachers left from fragment_cache
+    # (courses not in fragment_uses are kept, eg in the report server)
+    for course_code in course_codes:
+        if course_code not in fragment_uses:
+            continue
+        fragment_uses[course_code] -= 1
+        if fragment_uses[course_code] <= 0:
+            del fragment_uses[course_code]
+            for fragment_key in [fragment_key for fragment_key in fragment_cache if fragment_key[0] == course_code]:
+                del fragment_cache[fragment_key]
+
+def report_template_vars(teacher_erna_id, pers_name, courses_details_rep, open_answers_index, nodata_flag = False, teacher_stats_rep = None, history_rep = None,
+                        open_answers_summary = None, data_version = None):
+    # collect teacher stats, courses details and open answers for one teacher as Jinja template vars
+    # Format courses_open_answers: [str_course_feature_html, etc.] (see course_feature_html)
+    with stage_timer('open_answer_assembly'):
+        courses_taught = courses_details_rep.xs(['course_code', 'course_name'], axis = 1).drop_duplicates()
+        courses_index = []
+        courses_open_answers = []
+        for index, row in courses_taught.iterrows():
+            # get open questions data for this course from open_answers_index, try next course if there are no open answers
+            if row['course_code'] not in open_answers_index:
+                continue
+            course_name = row['course_name']
+            # update course index for this course (for sidebar)
+            courses_index.append(course_name)
+            # add open questions section for this course to report
+            if open_answers_index[row['course_code']]:
+                course_summary = open_answers_summary.get(row['course_code']) if open_answers_summary is not None else None
+                courses_open_answers.append(course_feature_html(row['course_code'], course_name, open_answers_index[row['course_code']], nodata_flag, course_summary, data_version))
+
+    # rename and reshape courses_details_rep for reporting, render as HTML table (with nodata option)
+    with stage_timer('courses_details_table'):
+        courses_details_rep = courses_details_rep.rename(columns = {'course_code' : 'Course code',
+                                                                    'course_name' : 'Course name',
+                                                                    'educ_form' : 'Education form',
+                                                                    'resp_count' : '# Respondents',
+                                                                    'item' : 'Item',
+                                                                    'score' : 'Score'})
+        courses_details_rep = courses_details_rep.set_index(['Course code', 'Course name', 'Education form', '# Respondents', 'Item'])
+        courses_details_html = html_table_out(courses_details_rep, 'one-column-emphasis', nodata_flag = nodata_flag)
+        if teacher_stats_rep is not None and len(teacher_stats_rep):
+            teacher_stats_html = html_table_out(teacher_stats_rep, 'one-column-emphasis-teacher', nodata_flag = nodata_flag)
+        else:
+            teacher_stats_html = ''
+        if history_rep is not None and len(history_rep):
+            history_html = html_table_out(history_rep, 'one-column-emphasis-teacher', nodata_flag = nodata_flag)
+        else:
+            history_html = ''
+
+    # set Jinja template vars, with nodata option
+    template_vars = {'name' : pers_name,
+                    'erna' : teacher_erna_id,
+                    'teacher_statistics' : teacher_stats_html,
+                    'teacher_history' : history_html,
+                    'courses_details' : courses_details_html,
+                    'courses_index' : courses_index,
+                    'courses_features' : courses_open_answers,
+                    'nodata' : nodata_flag
+                    }
+
+    return template_vars
+
+def report_template():
+    # Jinja template (templatefile in main_dir), loaded once per process
+    global template
+    if template is None:
+        from jinja2 import Environment, FileSystemLoader # templating engine
+        template = Environment(loader = FileSystemLoader(main_dir)).get_template(templatefile)
+
+    return template
+
+def weasyprint_stylesheet():
+    # @page CSS equivalent to the wkhtmltopdf pdfoptions (page size, margins and footer), created once per process
+    global weasyprint_css
+    if weasyprint_css is None:
+        import weasyprint # in-process HTML to PDF engine, only needed for --pdf-backend weasyprint
+        footer_content = lambda text: '"{}"'.format(text.replace('[page]', '" counter(page) "').replace('[toPage]', '" counter(pages) "').replace('[date]', time.strftime('%d-%m-%Y')))
+        css = '''@page {{
+                    size: {page-size};
+                    margin: {margin-top} {margin-right} {margin-bottom} {margin-left};
+                    @bottom-left {{content: {footer_left}; font-family: {footer-font-name}; font-size: {footer-font-size}pt}}
+                    @bottom-right {{content: {footer_right}; font-family: {footer-font-name}; font-size: {footer-font-size}pt}}
+                    }}'''
+        css = css.format(footer_left = footer_content(pdfoptions['footer-left']), footer_right = footer_content(pdfoptions['footer-right']), **pdfoptions)
+        weasyprint_css = weasyprint.CSS(string = css)
+
+    return weasyprint_css
+
+def write_pdf(html_out, pdf_path, pdf_backend = 'wkhtmltopdf'):
+    # output PDF, with wkhtmltopdf (one process per report) or in-process with WeasyPrint (stylesheet and fonts loaded once per process)
+    global pdfconfiguration
+    if pdf_backend == 'weasyprint':
+        import weasyprint
+        weasyprint.HTML(string = html_out, base_url = main_dir).write_pdf(pdf_path, stylesheets = [weasyprint_stylesheet()])
+    else:
+        import pdfkit # to Py wrapper for wkhtmltopdf.exe
+        if pdfconfiguration is None:
+            pdfconfiguration = pdfkit.configuration(wkhtmltopdf = wkhtmltopdf_exe)
+        pdfkit.from_string(html_out, pdf_path, options = pdfoptions, configuration = pdfconfiguration)
+
+def write_pdf_retry(html_out, pdf_path, pdf_backend = 'wkhtmltopdf'):
+    # output PDF to a temporary file and rename it to pdf_path when done, an interrupted run does not leave a broken PDF
+    # a failed output is retried pdf_retries times (waiting retry_delay, 2 x retry_delay, ...), returns the error of the last try or None
+    for attempt in range(pdf_retries + 1):
+        try:
+            write_pdf(html_out, pdf_path + '.part', pdf_backend)
+            if os.path.isfile(pdf_path):
+                os.remove(pdf_path)
+            os.rename(pdf_path + '.part', pdf_path)
+            return None
+        except Exception as error:
+            if os.path.isfile(pdf_path + '.part'):
+                os.remove(pdf_path + '.part')
+            if attempt < pdf_retries:
+                time.sleep(retry_delay * 2 ** attempt)
+
+    return '{!r}'.format(error)
+
+def write_report(report_job):
+    # render HTML and output PDF (and HTML with html_flag) for one teacher in output_path, module level function so it can be sent to a worker process
+    # returns the error of the PDF output (after the retries), None if the report was written
+    teacher_erna_id, template_vars, filename_string, pdf_backend, output_path, html_flag = report_job
+    with stage_timer('template_render'):
+        html_out = report_template().render(template_vars)
+    # output PDF
+    with stage_timer('pdf_write'):
+        error = write_pdf_retry(html_out, os.path.join(output_path, filename_string + '.pdf'), pdf_backend)
+    report_times = dict((stage, stage_times[stage][-1]) for stage in ['template_render', 'pdf_write'])
+    if error:
+        return os.getpid(), teacher_erna_id, report_times, [], error
+    output_files = [filename_string + '.pdf']
+    # output HTML
+    if html_flag:
+        with open(os.path.join(output_path, filename_string + '.html'), 'w') as file_out:
+            file_out.write(html_out.encode('utf-8'))
+        output_files.append(filename_string + '.html')
+
+    # report_times: timings of this report, to be added to stage_times of the main process when run in a worker process
+    return os.getpid(), teacher_erna_id, report_times, output_files, None
+
+def xlsx_text(elem):
+    # text of an xlsx text element (t, v) as read by xlrd: stripped unless marked xml:space="preserve", _xHHHH_ escapes replaced
+    text = unicode(elem.text or '')
+    if elem.get(xml_space) != 'preserve':
+        text = text.strip(' \t\n\r')
+
+    return re.sub(r'_x([0-9A-Fa-f]{4})_', lambda match: unichr(int(match.group(1), 16)), text)
+
+def xlsx_rich_text(elem):
+    # text of a shared string (si) or inline string (is) as read by xlrd: its t element and the t elements of its runs (r), each as xlsx_text
+    texts = []
+    for child in elem:
+        if child.tag == xlsx_ns + 't':
+            texts.append(xlsx_text(child))
+        elif child.tag == xlsx_ns + 'r':
+            texts.extend(xlsx_text(run_child) for run_child in child if run_child.tag == xlsx_ns + 't')
+
+    return u''.join(texts)
+
+def xlsx_value(cell, shared_strings):
+    # value of an xlsx cell element (c) as read by pd.read_excel (xlrd): text as xlsx_text, numbers as float (int if whole), empty and
+    # error cells as NaN (dates are read as numbers, not used in the open questions export)
+    cell_type = cell.get('t', 'n')
+    if cell_type == 'inlineStr':
+        inline_string = cell.find(xlsx_ns + 'is')
+        return xlsx_rich_text(inline_string) if inline_string is not None else u''
+    value = cell.find(xlsx_ns + 'v')
+    if value is None or not value.text or cell_type == 'e':
+        return np.nan
+    if cell_type == 's':
+        return shared_strings[int(value.text)]
+    if cell_type in ['str', 'd']:
+        return xlsx_text(value)
+    if cell_type == 'b':
+        return bool(int(value.text))
+    number = float(value.text)
+
+    return int(number) if number == int(number) else number
+
+def xlsx_parts(archive):
+    # paths of the first worksheet and of the shared strings table (None if there is none) in an xlsx archive
+    workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    relations = dict((relation.get('Id'), relation) for relation in ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels')))
+    part_path = lambda target: target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+    sheet_path = part_path(relations[workbook.find(xlsx_ns + 'sheets')[0].get(xlsx_relation_id)].get('Target'))
+    strings_path = None
+    for relation in relations.values():
+        if relation.get('Type').endswith('/sharedStrings'):
+            strings_path = part_path(relation.get('Target'))
+
+    return sheet_path, strings_path
+
+def read_xlsx_rows(file_path):
+    # rows of the first worksheet of an xlsx file as lists of cell values (see xlsx_value), parsed row by row, rows padded with NaN to the
+    # width of the first row. The shared strings table (xlsx saved by Excel: all texts of the workbook) is loaded first
+    archive = zipfile.ZipFile(file_path)
+    try:
+        sheet_path, strings_path = xlsx_parts(archive)
+        shared_strings = []
+        if strings_path:
+            for event, elem in ElementTree.iterparse(archive.open(strings_path)):
+                if elem.tag == xlsx_ns + 'si':
+                    shared_strings.append(xlsx_rich_text(elem))
+                    elem.clear()
+        width = None
+        for event, elem in ElementTree.iterparse(archive.open(sheet_path)):
+            if elem.tag != xlsx_ns + 'row':
+                continue
+            row = {}
+            column = -1
+            for cell in elem.findall(xlsx_ns + 'c'):
+                if cell.get('r'):
+                    column = reduce(lambda total, letter: total * 26 + ord(letter) - 64, re.match(r'\$?([A-Z]+)', cell.get('r')).group(1), 0) - 1
+                else:
+                    column += 1
+                row[column] = xlsx_value(cell, shared_strings)
+            elem.clear()
+            if width is None:
+                width = max(row) + 1 if row else 0
+            yield [row.get(column, np.nan) for column in range(width)]
+    finally:
+        archive.close()
+
+def read_open_answers_streaming(file_path):
+    # read the open questions export row by row and keep only open_answer_columns of the rows with a question in open_questions,
+    # for csv peak memory depends on the number of answers kept, not on the size of the export (xlsx saved by Excel: the shared strings
+    # table with all texts of the export is loaded, see read_xlsx_rows)
+    if file_path.lower().endswith('.csv'):
+        f_in = open(file_path, 'rb')
+        header_line = f_in.readline().replace('\xef\xbb\xbf', '') # strip BOM
+        delimiter = ';' if ';' in header_line else ',' # Excel with Dutch settings exports csv with ;
+        header = next(csv.reader([header_line], delimiter = delimiter))
+        rows = csv.reader(f_in, delimiter = delimiter)
+        decode = lambda value: value.decode('utf-8')
+    else:
+        rows = read_xlsx_rows(file_path)
+        header = next(rows)
+        decode = lambda value: value # values as read by pd.read_excel, see xlsx_value
+    column_positions = [header.index(column) for column in open_answer_columns]
+    question_position = header.index('VRG_TEXT_NL')
+    open_answers = []
+    for row in rows:
+        if decode(row[question_position]) in open_questions:
+            open_answers.append([decode(row[position]) for position in column_positions])
+    if file_path.lower().endswith('.csv'):
+        f_in.close()
+    else:
+        rows.close()
+
+    df_open_answers = pd.DataFrame(open_answers, columns = open_answer_columns)
+    df_open_answers = df_open_answers.replace(na_values, np.nan)
+
+    return df_open_answers
+
+def load_teacher_data():
+    # read Excel source file with teacher scores
     df_teacher_data = pd.read_excel(os.path.join(main_dir, teacherfile))
     df_teacher_data = df_teacher_data.drop(['Teacher name', 'Period'], axis = 1)
     df_teacher_data = df_teacher_data.rename(columns = {'Teacher code' : 'teacher_erna',
@@ -98,152 +490,488 @@ def main(options):
                                                          'Ik heb veel geleerd in dit vak' : 'I learned much in this course'
                                                          })
     df_teacher_data = df_teacher_data.replace(r'\n', '/ ', regex = True)
-    df_teacher_data['teacher_erna'] = df_teacher_data['teacher_erna'].str[:-3].astype(int)
+    df_teacher_data['teacher_erna'] = educ_eval_teacher_index.normalise_erna(df_teacher_data['teacher_erna'])
     course_score_col = df_teacher_data.pop('course_score')
     df_teacher_data.insert(0, 'Course score', course_score_col)
     df_teacher_data = df_teacher_data.sort_values(['teacher_erna', 'course_code'], ascending = [True, False])
     
     # print df_teacher_data.loc[0,:]
-    
-    df_open_answers = pd.read_excel(os.path.join(main_dir, openquestionfile))
+
+    return df_teacher_data
+
+def load_open_answers(stream_open_answers = False):
+    # read Excel source file with open answers
+    if stream_open_answers:
+        df_open_answers = read_open_answers_streaming(os.path.join(main_dir, openquestionfile))
+    else:
+        df_open_answers = pd.read_excel(os.path.join(main_dir, openquestionfile))
+        df_open_answers = df_open_answers[open_answer_columns]
     df_open_answers = df_open_answers.rename(columns = {'EVL_VAK' : 'course_code',
                                                          'VRG_TEXT_NL' : 'question_text',
                                                          'ROP_CONTENT' : 'resp_value'})
-    df_open_answers = df_open_answers.loc[(df_open_answers['question_text'] == 'Wat heb je gewaardeerd in dit vak?') | (df_open_answers['question_text'] == 'Welke suggesties heb je om dit vak te verbeteren?')]
-    df_open_answers = df_open_answers.replace('Wat heb je gewaardeerd in dit vak?', 'What did you appreciate in this course?')
-    df_open_answers = df_open_answers.replace('Welke suggesties heb je om dit vak te verbeteren?', 'Which suggestions do you have to improve this course?')
+    df_open_answers = df_open_answers.loc[df_open_answers['question_text'].isin(open_questions.keys())]
+    df_open_answers = df_open_answers.replace(open_questions)
     df_open_answers = df_open_answers.sort_values(['course_code', 'question_text'])
     df_open_answers = df_open_answers.set_index('course_code')
 
-    # add calculated total_value to df_teacher_data
-    # df_teacher_data['total_value'] = df_teacher_data['resp_value'] * df_teacher_data['resp_count']
-
-    # create teacher stats pivot
-    # teacher_stats = df_teacher_data[~df_teacher_data['question_text'].str.contains('good command of the English language')]
-    # teacher_stats = teacher_stats.groupby(['teacher_erna', 'course_year'])[['resp_count', 'total_value']].sum()
-    # teacher_stats['teacher_score'] = teacher_stats['total_value'] / teacher_stats['resp_count']
-    # teacher_stats = teacher_stats.dropna().round(2)
-    # teacher_stats = teacher_stats.drop(['total_value', 'resp_count'], axis = 1)
-    # teacher_stats = teacher_stats.sort_index(ascending = False)
-    # teacher_stats = teacher_stats.rename_axis(['erna id', 'year']).rename(columns = {'teacher_score' : 'teacher score'})
-
-    # create courses details pivot
-    # courses_details = df_teacher_data.groupby(['teacher_erna', 'course_year', 'course_name', 'question_text'])[['resp_count', 'total_value']].sum()
-    # courses_details['teacher_score'] = courses_details['total_value'] / courses_details['resp_count']
-    # courses_details = courses_details.dropna().round(2)
-    # courses_details = courses_details.drop('total_value', axis = 1)
-    # courses_details = courses_details.sort_index(level = ['teacher_erna', 'course_year', 'course_name', 'question_text'], ascending = [True, False, True, True])
-        # Broken implementation in pandas 0.2, wil be fixed in 0.21 (https://github.com/pandas-dev/pandas/issues/16934)
-    # courses_details = courses_details.rename_axis(['erna id', 'year', 'course', 'question']).rename(columns = {'resp_count' : 'respondents', 'teacher_score' : 'teacher score'})
+    return df_open_answers
 
+def courses_details_pivot(df_teacher_data):
     # create course_details pivot (v 2018)
     courses_details = pd.melt(df_teacher_data, id_vars = ['teacher_erna', 'course_code', 'course_name', 'educ_form', 'resp_count'], var_name = 'item', value_name = 'score')
     courses_details = courses_details.sort_values(['teacher_erna', 'course_name', 'course_code', 'educ_form'], ascending = [True, False, True, True])
     courses_details = courses_details.dropna()
     courses_details = courses_details.set_index('teacher_erna')
-    
+
+    return courses_details
+
+def teacher_statistics(courses_details):
+    # teacher score for all teachers: response weighted, all teacher items minus 'Good command of English language' (see educ_eval_aggregate)
+    # items with a text score (not a number) are left out, also in the respondents (count_missing_resp)
+    teacher_stats = educ_eval_aggregate.teacher_scores(courses_details.reset_index(), ['teacher_erna'], exclude_items = course_items, count_missing_resp = False)
+    teacher_stats = teacher_stats.round(2)
+    teacher_stats = teacher_stats.drop('resp_count', axis = 1)
+    teacher_stats = teacher_stats.rename_axis('erna id').rename(columns = {'score' : 'Teacher score'})
+
+    return teacher_stats
+
+def teacher_history(erna_ids, years = None):
+    # teacher score per year (latest year first) for the teachers in erna_ids, read from the multi-year store (only the needed years,
+    # columns and row groups, see educ_eval_store)
+    history = educ_eval_store.read_store(os.path.join(main_dir, store_dir), erna_ids, years, ['resp_count', 'item', 'score'])
+    history = educ_eval_aggregate.teacher_scores(history, ['teacher_erna', 'course_year'], exclude_items = course_items, count_missing_resp = False)
+    history = history.round(2)
+    history = history.drop('resp_count', axis = 1)
+    history = history.sort_index(level = ['teacher_erna', 'course_year'], ascending = [True, False])
+    history = history.rename_axis(['erna id', 'year']).rename(columns = {'score' : 'Teacher score'})
+
+    return history
+
+def ingest(year):
+    # add the courses details of the current teacher export to the multi-year store as the partition of year
+    df_teacher_data, df_open_answers, courses_details = load_data_cached()
+    row_count = educ_eval_store.write_partition(courses_details, year, os.path.join(main_dir, store_dir))
+    print 'ingested {} rows as {}, years in store: {}'.format(row_count, year, ', '.join(str(store_year) for store_year in educ_eval_store.store_years(os.path.join(main_dir, store_dir))))
+
+def load_data(stream_open_answers = False):
+    # read and clean Excel source files, create pivot for reporting
+    with stage_timer('load_teacher_data'):
+        df_teacher_data = load_teacher_data()
+    with stage_timer('load_open_answers'):
+        df_open_answers = load_open_answers(stream_open_answers)
+    with stage_timer('melt'):
+        courses_details = courses_details_pivot(df_teacher_data)
+
+    return df_teacher_data, df_open_answers, courses_details
+
+def frame_to_parquet(frame_in, file_path):
+    # Parquet needs string column names and columns of a single type, object columns mixing text and numbers (eg u'4,41' and 4.2)
+    # are stored as a numeric column plus a text column (suffix mixed_suffix)
+    frame_out = frame_in.rename(columns = unicode)
+    for column in frame_out.columns[frame_out.dtypes == object]:
+        is_text = frame_out[column].map(lambda value: isinstance(value, basestring))
+        if is_text.any() and frame_out.loc[~is_text, column].notnull().any():
+            frame_out[column + mixed_suffix] = frame_out[column].where(is_text)
+            frame_out[column] = pd.to_numeric(frame_out[column].where(~is_text))
+    frame_out.to_parquet(file_path)
+
+def frame_from_parquet(file_path):
+    frame_out = pd.read_parquet(file_path)
+    for text_column in frame_out.columns[frame_out.columns.str.endswith(mixed_suffix)]:
+        column = text_column[:-len(mixed_suffix)]
+        is_text = frame_out[text_column].notnull()
+        frame_out[column] = frame_out[column].astype(object)
+        frame_out.loc[is_text, column] = frame_out.loc[is_text, text_column]
+        del frame_out[text_column]
+    # missing values in object columns are read as None, restore NaN as read by pd.read_excel
+    for column in frame_out.columns[frame_out.dtypes == object]:
+        frame_out[column] = frame_out[column].where(frame_out[column].notnull(), np.nan)
+
+    return frame_out
+
+def group_open_answers(df_open_answers):
+    # collect the open answers for all courses in one pass
+    # Format open_answers_index: {str_course_code: {str_question_text: [list_open_questions_answers]}}, questions ordered according to sort_list
+    open_answers_index = {}
+    for course_code, question_text, resp_value in zip(df_open_answers.index, df_open_answers['question_text'], df_open_answers['resp_value']):
+        open_answers_index.setdefault(course_code, {}).setdefault(question_text, []).append(resp_value)
+    for course_code, open_answer_dict in open_answers_index.items():
+        open_answer_dict_sorted = OrderedDict()
+        for search_item in sort_list:
+            if search_item in open_answer_dict:
+                open_answer_dict_sorted[search_item] = open_answer_dict.pop(search_item)
+        open_answer_dict_sorted.update(open_answer_dict)
+        open_answers_index[course_code] = open_answer_dict_sorted
+
+    return open_answers_index
+
+def template_key():
+    # md5 hash of the template file, read once per run (main_dir can be a network share)
+    with open(report_template().filename, 'rb') as f_in:
+        return hashlib.md5(f_in.read()).hexdigest()
+
+def report_key(template_vars, template_hash, pdf_backend = 'wkhtmltopdf'):
+    # content hash of everything that goes into a report: template vars (courses details and open answers), template file (template_hash,
+    # see template_key), PDF options and PDF backend (both backends output the same file name)
+    md5 = hashlib.md5()
+    md5.update(json.dumps([template_vars, template_hash, pdfoptions, pdf_backend], sort_keys = True, default = unicode))
+
+    return md5.hexdigest()
+
+def source_key(file_name, cached_key = None):
+    # mtime, size and md5 hash of a source file, used as cache key
+    # the md5 hash is only recomputed if mtime or size differ from the cached key
+    file_path = os.path.join(main_dir, file_name)
+    key = {'mtime' : os.path.getmtime(file_path), 'size' : os.path.getsize(file_path)}
+    if cached_key and cached_key['mtime'] == key['mtime'] and cached_key['size'] == key['size']:
+        key['md5'] = cached_key['md5']
+    else:
+        md5 = hashlib.md5()
+        with open(file_path, 'rb') as f_in:
+            for chunk in iter(lambda: f_in.read(1024 * 1024), b''):
+                md5.update(chunk)
+        key['md5'] = md5.hexdigest()
+
+    return key
+
+def load_data_cached(rebuild_cache = False, stream_open_answers = False):
+    # load cleaned data from the Parquet cache, (re)build the cache from the Excel source files if it is stale
+    cache_path = os.path.join(main_dir, cache_dir)
+    cache_meta_file = os.path.join(cache_path, 'cache_meta.json')
+    cache_meta = {'script_version' : None, 'stream_open_answers' : None, 'sources' : {}}
+    if not rebuild_cache and os.path.isfile(cache_meta_file):
+        with open(cache_meta_file) as f_in:
+            cache_meta = json.load(f_in)
+    cache_key = {'script_version' : script_version, 'stream_open_answers' : stream_open_answers, 'sources' : {}} # reader of the open questions export
+    for file_name in [teacherfile, openquestionfile]:
+        cache_key['sources'][file_name] = source_key(file_name, cache_meta['sources'].get(file_name))
+    # a touched or copied source file (different mtime, same md5 hash) does not invalidate the cache
+    cache_valid = cache_meta['script_version'] == script_version and cache_meta.get('stream_open_answers') == stream_open_answers
+    for file_name, key in cache_key['sources'].items():
+        cache_valid = cache_valid and cache_meta['sources'].get(file_name, {}).get('md5') == key['md5']
+    if cache_valid:
+        print 'loading data from cache'
+        with stage_timer('load_cache'):
+            return tuple(frame_from_parquet(os.path.join(cache_path, frame_name + '.parquet')) for frame_name in cache_frames)
+    print 'loading data from Excel source files'
+    frames = load_data(stream_open_answers)
+    try:
+        if not os.path.isdir(cache_path):
+            os.mkdir(cache_path)
+        for frame_name, frame in zip(cache_frames, frames):
+            frame_to_parquet(frame, os.path.join(cache_path, frame_name + '.parquet'))
+        with open(cache_meta_file, 'w') as f_out:
+            json.dump(cache_key, f_out, indent = 4)
+    except ImportError: # pyarrow not installed, run without cache
+        print 'data cache not available (install pyarrow)'
+
+    return frames
+
+def report_name(teacher_erna_id, pers_name, dept, nodata_flag = False):
+    # output file name (without extension) for the selected output format, no side effects (used by the report server for each request)
+    # raises ValueError for an unknown output format
+    if nodata_flag:
+        nodata_string = '_NODATA'
+    else:
+        nodata_string = ''
+    if output_format == 'stand_alone':
+        filename_string = os.path.join(dept, 'Educ_eval_{}_{}_{}{}'.format(pers_name.replace(' ', '_'), teacher_erna_id, dept, nodata_string))
+    elif output_format == 'stand_alone_flat':
+        filename_string = 'Educ_eval_{}_{}_{}{}'.format(pers_name.replace(' ', '_'), teacher_erna_id, dept, nodata_string)
+    elif output_format == 'ro':
+        filename_string = '{}{}'.format(teacher_erna_id, nodata_string)
+    else:
+        raise ValueError('Unknown output format: {}'.format(output_format))
+
+    return filename_string
+
+def report_filename(teacher_erna_id, pers_name, dept, nodata_flag = False, output_path = None):
+    # output file name (without extension) for the selected output format (see report_name), creates the department subfolder in
+    # output_path (default: report_dir) for 'stand_alone'
+    output_path = output_path or os.path.join(main_dir, report_dir)
+    try:
+        filename_string = report_name(teacher_erna_id, pers_name, dept, nodata_flag)
+    except ValueError:
+        print 'No output format selected, exiting!'
+        exit()
+    if output_format == 'stand_alone' and not os.path.isdir(os.path.join(output_path, dept)):
+        os.mkdir(os.path.join(output_path, dept))
+
+    return filename_string
+
+def teacher_slices(input_teachers, teacher_frames):
+    # pipeline stage 1: rows of each teacher in the indexed frames (views, see educ_eval_teacher_index)
+    # teacher_frames: {'courses_details' : (frame, teacher_offsets), 'teacher_stats' : (...), optional 'history' : (...)}
+    for teacher_erna_id, pers_name, dept, erna_id in input_teachers:
+        teacher_start = time.time()
+        with stage_timer('teacher_lookup'):
+            teacher_slice = dict((frame_name, educ_eval_teacher_index.teacher_rows(frame, teacher_offsets, erna_id, drop_level = frame_name == 'history'))
+                                for frame_name, (frame, teacher_offsets) in teacher_frames.items())
+        yield teacher_start, teacher_erna_id, pers_name, dept, teacher_slice
+
+def read_journal(journal_path):
+    # last entry per teacher in the journal of a previous (interrupted) run, {teacher: entry}, empty if there is no journal
+    # the line of an interrupted write is skipped and terminated, new entries are appended on their own line
+    journal = {}
+    if os.path.isfile(journal_path):
+        line = '\n' # empty journal
+        with open(journal_path) as f_in:
+            for line in f_in:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                journal[entry['teacher']] = entry
+        if not line.endswith('\n'):
+            with open(journal_path, 'a') as f_out:
+                f_out.write('\n')
+
+    return journal
+
+def log_line(f_out, line):
+    # append a line to a journal / log file and flush it to disk, so it survives a crash of the run
+    f_out.write(line + '\n')
+    f_out.flush()
+    os.fsync(f_out.fileno())
+
+def journal_entry(f_journal, teacher_erna_id, status, manifest_item = None, error = None):
+    # record a teacher as done (with its manifest item), failed (with the error) or missing in the journal
+    entry = {'teacher' : teacher_erna_id, 'status' : status, 'time' : time.strftime('%Y-%m-%d %H:%M:%S')}
+    if manifest_item:
+        entry.update(manifest_item)
+    if error:
+        entry['error'] = error
+    log_line(f_journal, json.dumps(entry, sort_keys = True))
+
+def report_exists(file_name, output = 'files', nodata_flag = False, previous_entries = None):
+    # output file of the previous run still exists, in report_dir or (output zip) in its archive in report_dir
+    # previous_entries: {archive file: names in the archive}, filled on first use of each archive
+    if output == 'zip':
+        archive_file, entry_name = educ_eval_output.archive_location(file_name, nodata_flag)
+        if archive_file not in previous_entries:
+            previous_entries[archive_file] = educ_eval_output.archive_entries(os.path.join(main_dir, report_dir, archive_file))
+        return entry_name in previous_entries[archive_file]
+
+    return os.path.isfile(os.path.join(main_dir, report_dir, file_name))
+
+def report_jobs(teacher_slices, open_answers_index, options, manifest_old, manifest_new, open_answers_summary = None, output_path = None):
+    # pipeline stage 2: template vars and output file of each teacher as report job for write_report, yields (assembly time, report job)
+    # adds each report to manifest_new, skips reports that did not change since the previous run (with --incremental)
+    output_path = output_path or os.path.join(main_dir, report_dir)
+    previous_entries = {}
+    template_hash = template_key()
+    for teacher_start, teacher_erna_id, pers_name, dept, teacher_slice in teacher_slices:
+        if options.workers <= 1:
+            print 'processing:', teacher_erna_id
+        template_vars = report_template_vars(teacher_erna_id, pers_name, teacher_slice['courses_details'], open_answers_index, options.nodata, teacher_slice['teacher_stats'], teacher_slice.get('history'),
+                                            open_answers_summary)
+        release_fragments(teacher_slice['courses_details']['course_code'].unique())
+        with stage_timer('report_key'):
+            filename_string = report_filename(teacher_erna_id, pers_name, dept, options.nodata, output_path)
+            manifest_new[teacher_erna_id] = {'hash' : report_key(template_vars, template_hash, options.pdf_backend), 'file' : filename_string + '.pdf'}
+        # skip report if it did not change since the previous run and the output files (PDF, with --html also HTML) still exist (with --incremental)
+        if (options.incremental and manifest_old.get(teacher_erna_id) == manifest_new[teacher_erna_id]
+                and all(report_exists(filename_string + extension, options.output, options.nodata, previous_entries) for extension in ['.pdf'] + (['.html'] if options.html else []))):
+            continue
+        yield time.time() - teacher_start, (teacher_erna_id, template_vars, filename_string, options.pdf_backend, output_path, options.html)
+
+def write_reports(report_jobs, workers = 1, max_inflight = 2):
+    # pipeline stage 3: render HTML and output PDF for each report job, directly or (workers > 1) in a process pool while the next
+    # jobs are assembled, at most max_inflight jobs are waiting in the pool, yields (assembly time, write_report result) in input order
+    if workers <= 1:
+        for assembly_time, report_job in report_jobs:
+            yield assembly_time, write_report(report_job)
+        return
+    pool = multiprocessing.Pool(workers)
+    try:
+        inflight = deque()
+        for assembly_time, report_job in report_jobs:
+            inflight.append((assembly_time, pool.apply_async(write_report, (report_job, ))))
+            del report_job # only kept by the pool until it is sent to a worker
+            if len(inflight) >= max_inflight:
+                assembly_time, report_result = inflight.popleft()
+                yield assembly_time, report_result.get()
+        while inflight:
+            assembly_time, report_result = inflight.popleft()
+            yield assembly_time, report_result.get()
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+# main
+def main(options):
+    if options.ingest:
+        ingest(options.ingest)
+        return
+    if options.resume and options.output != 'files':
+        opt_parser.error('--resume can only be used with --output files (staged reports of an interrupted run are not kept)')
+    run_start = time.time()
+    teacher_times = {} # time spent per teacher, for p50 / p95 in timings_summary
+    # load cleaned data (from cache if the source files and script version did not change)
+    df_teacher_data, df_open_answers, courses_details = load_data_cached(options.rebuild_cache, options.stream_open_answers)
+    with stage_timer('group_open_answers'):
+        open_answers_index = group_open_answers(df_open_answers)
+    with stage_timer('teacher_statistics'):
+        teacher_stats = teacher_statistics(courses_details)
+    # sentiment and top terms of the open answers per course (with --sentiment)
+    open_answers_summary = None
+    if options.sentiment:
+        with stage_timer('sentiment'):
+            if not os.path.isdir(os.path.join(main_dir, cache_dir)):
+                os.mkdir(os.path.join(main_dir, cache_dir))
+            open_answers_summary = educ_eval_sentiment.course_summaries(df_open_answers, os.path.join(main_dir, cache_dir, sentimentfile))
+    with stage_timer('teacher_index'):
+        courses_details, courses_offsets = educ_eval_teacher_index.teacher_index(courses_details)
+        teacher_stats, teacher_stats_offsets = educ_eval_teacher_index.teacher_index(teacher_stats)
+    del df_teacher_data, df_open_answers # not used after grouping / indexing, release before the report loop
+
+    # read input file, teachers without courses details are logged as missing
+    input_file = [line.split(';') for line in open(os.path.join(main_dir, inputfile)).read().splitlines()]
+    input_erna = educ_eval_teacher_index.normalise_erna([teacher_erna_id for teacher_erna_id, pers_name, dept in input_file])
+    input_missing = educ_eval_teacher_index.missing_teachers(input_erna, courses_offsets)
+    list_missing = [(teacher_erna_id, '{}; {}; {}'.format(teacher_erna_id, pers_name, dept)) for (teacher_erna_id, pers_name, dept), missing in zip(input_file, input_missing) if missing]
+    # teacher score per year (with --history)
+    if options.history is not None:
+        with stage_timer('teacher_history'):
+            history = teacher_history(input_erna[~input_missing], options.history)
+            history, history_offsets = educ_eval_teacher_index.teacher_index(history)
+    # manifest of the previous run, used to skip unchanged reports (with --incremental)
+    if options.nodata:
+        manifest_path = os.path.join(main_dir, manifestfile.format('_NODATA'))
+    else:
+        manifest_path = os.path.join(main_dir, manifestfile.format(''))
+    manifest_old = {}
+    if os.path.isfile(manifest_path):
+        with open(manifest_path) as f_in:
+            manifest_old = json.load(f_in)
+    manifest_new = {}
+    # journal of this run (with --resume: continue the journal of the interrupted run, teachers done in that run are not written again)
+    journal_path = os.path.join(main_dir, journalfile.format('_NODATA' if options.nodata else ''))
+    journal_old = {}
+    if options.resume:
+        journal_old = read_journal(journal_path)
+    teachers_done = set(teacher_erna_id for teacher_erna_id, entry in journal_old.items() if entry['status'] == 'done' and report_exists(entry['file']))
+    for teacher_erna_id in teachers_done:
+        manifest_new[teacher_erna_id] = {'hash' : journal_old[teacher_erna_id]['hash'], 'file' : journal_old[teacher_erna_id]['file']}
+    f_journal = open(journal_path, 'a' if options.resume else 'w')
+    f_failed = open(os.path.join(main_dir, failedfile), 'a' if options.resume else 'w')
+    # write log of missing teachers before the report loop
+    with open(os.path.join(main_dir, missingfile), 'w') as f_out:
+        for teacher_erna_id, item in list_missing:
+            log_line(f_out, item)
+            if journal_old.get(teacher_erna_id, {}).get('status') != 'missing':
+                journal_entry(f_journal, teacher_erna_id, 'missing')
+
     # iterate through input file, find course stats, course details and open answers to create individual reports
-    input_file = open(os.path.join(main_dir, inputfile)).read().splitlines()
-    list_missing = []
-    
-    for line in input_file:
-        teacher_erna_id, pers_name, dept = line.split(';')
-        print 'processing:', teacher_erna_id
-        # teacher stats & courses details
-        try:
-            courses_details_rep = courses_details.xs(int(teacher_erna_id))
-        except KeyError:
-            list_missing.append('{}; {}; {}'.format(teacher_erna_id, pers_name, dept))
+    # pipeline of generators (teacher slices > report jobs > HTML / PDF), a report is released as soon as its PDF is written
+    input_teachers = [(teacher_erna_id, pers_name, dept, erna_id) for (teacher_erna_id, pers_name, dept), erna_id, missing in zip(input_file, input_erna, input_missing)
+                    if not missing and teacher_erna_id not in teachers_done]
+    teacher_frames = {'courses_details' : (courses_details, courses_offsets), 'teacher_stats' : (teacher_stats, teacher_stats_offsets)}
+    # open answers sections are kept in fragment_cache until the last teacher of their course is assembled
+    with stage_timer('course_uses'):
+        fragment_cache.clear()
+        fragment_uses.clear()
+        fragment_uses.update(course_uses(courses_details, input_teachers))
+    if options.history is not None:
+        teacher_frames['history'] = (history, history_offsets)
+    # reports are output in report_dir, or (with --output staging / zip) in a local staging dir
+    if options.output == 'files':
+        output_path = os.path.join(main_dir, report_dir)
+    else:
+        output_path = educ_eval_output.staging_dir()
+    archives = {} # with --output zip
+    slices = teacher_slices(input_teachers, teacher_frames)
+    jobs = report_jobs(slices, open_answers_index, options, manifest_old, manifest_new, open_answers_summary, output_path)
+    teachers_written = set()
+    teachers_failed = set()
+    for assembly_time, (worker_pid, teacher_erna_id, report_times, output_files, error) in write_reports(jobs, options.workers, options.max_inflight or 2 * options.workers):
+        # failed report: logged, the previous report (if any) is kept in the manifest so the next (incremental) run tries again
+        if error:
+            teachers_failed.add(teacher_erna_id)
+            print 'failed: {} ({})'.format(teacher_erna_id, error)
+            with stage_timer('journal'):
+                journal_entry(f_journal, teacher_erna_id, 'failed', error = error)
+                log_line(f_failed, '{}; {}; {}'.format(teacher_erna_id, manifest_new[teacher_erna_id]['file'], error))
+            if teacher_erna_id in manifest_old:
+                manifest_new[teacher_erna_id] = manifest_old[teacher_erna_id]
+            else:
+                del manifest_new[teacher_erna_id]
             continue
-        # open questions
-        # Format courses_open_answers: [[str_course_name', {str_question_text: [list_open_questions_answers]}], etc.]
-        courses_taught = courses_details_rep.xs(['course_code', 'course_name'], axis = 1).drop_duplicates()
-        courses_index = []
-        courses_open_answers = []
-        for index, row in courses_taught.iterrows():
-            # get open questions data from df_open_answers for this course, try next course if there are no open answers
-            try:
-                course_features = df_open_answers.xs(row['course_code'])
-                if isinstance(course_features, pd.Series):
-                    course_features = course_features.to_frame().T
-            except KeyError:
-                continue
-            course_name = row['course_name']
-            # update course index for this course (for sidebar)
-            courses_index.append(course_name)
-            open_answer_dict = {}
-            # create dict with open questions for this course
-            for index, row in course_features.iterrows():
-                question_text = row['question_text']
-                open_answer_dict.setdefault(question_text, []).append(row['resp_value'])
-            # reorder dict with open questions for this course according to sort_list
-            sort_list = ['What did you appreciate in this course?',
-                        'Which suggestions do you have to improve this course?']
-            open_answer_dict_sorted = OrderedDict()
-            for search_item in sort_list:
-                if search_item in open_answer_dict.keys():
-                    open_answer_dict_sorted[search_item] = open_answer_dict.get(search_item)
-                    del open_answer_dict[search_item]
-            open_answer_dict_sorted.update(open_answer_dict)
-            # collect all open questions data for this course together
-            course_open_answers = []
-            course_open_answers.append(course_name)
-            course_open_answers.append(open_answer_dict_sorted)
-            # add collected open questions data for this course to report
-            courses_open_answers.append(course_open_answers)
-            
-        # rename and reshape courses_details_rep for reporting
-        courses_details_rep = courses_details_rep.rename(columns = {'course_code' : 'Course code',
-                                                                    'course_name' : 'Course name',
-                                                                    'educ_form' : 'Education form',
-                                                                    'resp_count' : '# Respondents',
-                                                                    'item' : 'Item',
-                                                                    'score' : 'Score'})
-        courses_details_rep = courses_details_rep.set_index(['Course code', 'Course name', 'Education form', '# Respondents', 'Item'])
-        
-        # set Jinja template vars and render HTML (with nodata option)
-        template_vars = {'name' : pers_name,
-                        'erna' : teacher_erna_id,
-                        'courses_details' : html_table_out(courses_details_rep, 'one-column-emphasis'),
-                        'courses_index' : courses_index,
-                        'courses_features' : courses_open_answers
-                        }
-        html_out = template.render(template_vars)
-        if options.nodata:
-            html_out = nodata(html_out)
-
-        # set up output
-        if options.nodata:
-            nodata_string = '_NODATA'
-        else:
-            nodata_string = ''
-        if output_format == 'stand_alone':
-            filename_string = os.path.join(dept, 'Educ_eval_{}_{}_{}{}'.format(pers_name.replace(' ', '_'), teacher_erna_id, dept, nodata_string))
-            if not os.path.isdir(os.path.join(main_dir, report_dir, dept)):
-                os.mkdir(os.path.join(main_dir, report_dir, dept))
-        elif output_format == 'stand_alone_flat':
-            filename_string = 'Educ_eval_{}_{}_{}{}'.format(pers_name.replace(' ', '_'), teacher_erna_id, dept, nodata_string)
-        elif output_format == 'ro':
-            filename_string = '{}{}'.format(teacher_erna_id, nodata_string)
-        else:
-            print 'No output format selected, exiting!'
-            exit()
-        # output PDF
-        pdfkit.from_string(html_out, os.path.join(main_dir, report_dir, filename_string + '.pdf'), options = pdfoptions, configuration = pdfconfiguration)
-        # output HTML
-        # with open(os.path.join(main_dir, report_dir, filename_string + '.html'), 'w') as file_out:
-            # file_out.write(html_out.encode('utf-8'))
-
-    # write simple log
-    with open(os.path.join(main_dir, 'LOG_missing_educ_eval_indiv_report.txt'), 'w') as f_out:
-        for item in list_missing:
-            line = item + '\n'
-            f_out.write(line)
+        teachers_written.add(teacher_erna_id)
+        with stage_timer('journal'):
+            journal_entry(f_journal, teacher_erna_id, 'done', manifest_new[teacher_erna_id])
+        if options.output == 'zip':
+            with stage_timer('archive'):
+                for output_file in output_files:
+                    educ_eval_output.add_to_archive(archives, output_path, output_file, teacher_erna_id, options.nodata)
+        if options.workers > 1:
+            print 'worker {}: done {} ({}/{})'.format(worker_pid, teacher_erna_id, len(teachers_written), len(input_teachers))
+            for stage, seconds in report_times.items():
+                stage_times.setdefault(stage, []).append(seconds)
+        teacher_times[teacher_erna_id] = assembly_time + sum(report_times.values())
+    count_written = len(teachers_written)
+    f_journal.close()
+    f_failed.close()
+
+    # copy staged reports / archives to report_dir, archives: copy unchanged reports (with --incremental) from the previous archives
+    if options.output != 'files':
+        with stage_timer('publish'):
+            if options.output == 'zip':
+                skipped_files = [os.path.splitext(manifest_item['file'])[0] + extension for teacher_erna_id, manifest_item in manifest_new.items()
+                                if teacher_erna_id not in teachers_written for extension in ['.pdf', '.html']]
+                skipped_files.sort()
+                educ_eval_output.carry_over(archives, output_path, os.path.join(main_dir, report_dir), skipped_files, options.nodata)
+                print 'archives written: {}'.format(', '.join(educ_eval_output.close_archives(archives, output_path, os.path.join(main_dir, report_dir))))
+            else:
+                print 'files copied: {}'.format(educ_eval_output.publish_staging(output_path, os.path.join(main_dir, report_dir)))
+            shutil.rmtree(output_path)
+
+    # remove reports of teachers that are no longer reported on (or with a changed file name) and write manifest for the next run
+    # (not needed with --output zip, archives only contain the reports of this run)
+    count_removed = 0
+    if options.incremental and options.output != 'zip':
+        for teacher_erna_id, manifest_item in manifest_old.items():
+            if manifest_new.get(teacher_erna_id, {}).get('file') != manifest_item['file'] and os.path.isfile(os.path.join(main_dir, report_dir, manifest_item['file'])):
+                os.remove(os.path.join(main_dir, report_dir, manifest_item['file']))
+                count_removed += 1
+                html_file = os.path.join(main_dir, report_dir, os.path.splitext(manifest_item['file'])[0] + '.html')
+                if os.path.isfile(html_file):
+                    os.remove(html_file)
+    with open(manifest_path, 'w') as f_out:
+        json.dump(manifest_new, f_out, indent = 4, sort_keys = True)
+    print 'reports skipped: {}, rebuilt: {}, removed: {}'.format(len(manifest_new) - count_written - len(teachers_done) - len(teachers_failed & set(manifest_new)), count_written, count_removed)
+    if teachers_done:
+        print 'reports done in the interrupted run: {}'.format(len(teachers_done))
+    if teachers_failed:
+        print 'reports failed: {} (see {})'.format(len(teachers_failed), failedfile)
+    print 'open answers sections rendered: {}, reused: {}'.format(fragment_counts['misses'], fragment_counts['hits'])
+
+    # report timings (with --timings or --profile)
+    if options.timings or options.profile:
+        summary = timings_summary(teacher_times, time.time() - run_start)
+        for stage, stage_summary in sorted(summary['stages'].items(), key = lambda item: -item[1]['total']):
+            print '{}: {:.3f} s total, {} calls, p50 {:.4f} s, p95 {:.4f} s'.format(stage, stage_summary['total'], stage_summary['count'], stage_summary['p50'], stage_summary['p95'])
+        if summary['per_teacher']:
+            print 'per teacher: p50 {:.4f} s, p95 {:.4f} s'.format(summary['per_teacher']['p50'], summary['per_teacher']['p95'])
+        if options.timings:
+            with open(options.timings, 'w') as f_out:
+                json.dump(summary, f_out, indent = 4, sort_keys = True)
 
     print 'Done'
 
+def run(args = None):
+    # parse the cli options (default: sys.argv) and run main, with --profile under cProfile
+    options = opt_parser.parse_args(args)
+    if options.profile:
+        profiler = cProfile.Profile()
+        profiler.runcall(main, options)
+        profiler.dump_stats(options.profile)
+    else:
+        main(options)
+
 if __name__ == '__main__':
-    main(options)
+    run()
 
 # USEFUL CODE SNIPPETS
     # temporary HTML writer for testing
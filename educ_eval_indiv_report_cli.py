@@ -0,0 +1,162 @@
+# Light command line entry point for the education evaluation reports, 2026_10_17
+# Pieter Vreeburg, E:vreeburg@ese.eur.nl
+
+# Starts with the std. library only and reads the config file (educ_eval_config), pandas, numpy, jinja2 and pdfkit are not loaded here.
+# Without --warm the remaining options are passed to educ_eval_indiv_report_2018.py, which is only imported then (and imports
+# jinja2 and pdfkit only for the stages that use them). With --warm the reports are requested from the warm report server
+# (educ_eval_indiv_report_server.py, exports, indexes and template loaded once and kept in memory), started in the background on the
+# first call, so repeated calls (eg once per teacher from the RO pipeline) do not load the exports again.
+
+# Watch out for
+    # The warm server keeps the data loaded at its start, --warm reloads it when the exports or the input file changed since (mtime and size
+        # compared with the source keys in /status of the server, md5 hash only if they differ), --reload forces a reload
+    # With --warm only --nodata of the report options can be used (no --incremental, --resume, --output, ...)
+    # The warm server keeps running after the call (output in LOG_server_educ_eval_indiv_report.txt in main_dir), stop it by ending its python process
+
+# cli options
+    # --warm: output the reports through the warm report server, started in the background if it is not running
+    # --teacher ERNA-ID [ERNA-ID ...]: with --warm, only output the reports of these teachers (default: all teachers in the input file)
+    # --reload: with --warm, reload the exports and input file in a running warm server first, also if they did not change
+    # --nodata: represent all data cells in the report as XXX
+    # other options are passed to educ_eval_indiv_report_2018.py (see its cli options)
+
+# imports
+import os # os operations, from std. library
+import sys # python executable and exit code, from std. library
+import argparse # command line parsing, from std. library
+import json # status response, from std. library
+import hashlib # md5 hash of the source files, from std. library
+import time # waiting for the warm server, from std. library
+import socket # connection errors, from std. library
+import subprocess # start the warm server, from std. library
+import urllib # quote ERNA-ids in request paths, from std. library
+import urllib2 # requests to the warm server, from std. library
+
+import educ_eval_config # config file (dirs / files, address of the warm server)
+
+# set dirs / files (see CONFIG_educ_eval_indiv_report.ini)
+config = educ_eval_config.read_config()
+server_url = 'http://{}:{}'.format(config['server_host'], config['server_port'])
+server_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'educ_eval_indiv_report_server.py')
+serverlog = 'LOG_server_educ_eval_indiv_report.txt' # output of the warm server started by this script, in main_dir
+missingfile = 'LOG_missing_educ_eval_indiv_report.txt' # teachers without report data, in main_dir (as educ_eval_indiv_report_2018.py)
+
+# set warm server options
+start_timeout = 600 # seconds to wait for the warm server to load the exports
+request_timeout = 330 # seconds to wait for one report (server: 300 s)
+
+# set up cli options parser
+opt_parser = argparse.ArgumentParser(epilog = 'Other options are passed to educ_eval_indiv_report_2018.py')
+opt_parser.add_argument('--warm', help = 'Output the reports through the warm report server (started if it is not running)', action = 'store_true')
+opt_parser.add_argument('--teacher', help = 'With --warm, only output the reports of these teachers', nargs = '+', metavar = 'ERNA-ID')
+opt_parser.add_argument('--reload', help = 'With --warm, reload the exports and input file in the warm server first', action = 'store_true')
+opt_parser.add_argument('--nodata', help = 'Produce reports with data cells represented as XXX', action = 'store_true')
+
+# functions
+def server_status():
+    # status of the warm server (JSON), None if it is not running
+    try:
+        return json.load(urllib2.urlopen(server_url + '/status', timeout = 2))
+    except (urllib2.URLError, socket.error, ValueError):
+        return None
+
+def start_server():
+    # start the warm server in the background (detached, it keeps running after this call) and wait until it has loaded the exports
+    log_out = open(os.path.join(config['main_dir'], serverlog), 'a')
+    if os.name == 'nt':
+        detach = {'creationflags' : 0x00000008} # DETACHED_PROCESS
+    else:
+        detach = {'preexec_fn' : os.setsid, 'close_fds' : True} # new session
+    server = subprocess.Popen([sys.executable, server_script, '--host', config['server_host'], '--port', str(config['server_port'])],
+                            stdout = log_out, stderr = subprocess.STDOUT, **detach)
+    log_out.close()
+    start = time.time()
+    while time.time() - start < start_timeout:
+        status = server_status()
+        if status is not None:
+            return status
+        if server.poll() is not None:
+            raise RuntimeError('Warm server stopped, see {}'.format(serverlog))
+        time.sleep(0.2)
+    raise RuntimeError('Warm server not ready after {} s, see {}'.format(start_timeout, serverlog))
+
+def sources_changed(status):
+    # source files (exports and input file) changed since the warm server loaded them, compared with the source keys in its status
+    # (mtime and size, md5 hash only if they differ, as source_key in educ_eval_indiv_report_2018.py)
+    server_sources = status.get('sources', {})
+    for file_name in [config['teacherfile'], config['openquestionfile'], config['inputfile']]:
+        if file_name not in server_sources:
+            return True
+        file_path = os.path.join(config['main_dir'], file_name)
+        if os.path.getmtime(file_path) == server_sources[file_name]['mtime'] and os.path.getsize(file_path) == server_sources[file_name]['size']:
+            continue
+        md5 = hashlib.md5()
+        with open(file_path, 'rb') as f_in:
+            for chunk in iter(lambda: f_in.read(1024 * 1024), b''):
+                md5.update(chunk)
+        if md5.hexdigest() != server_sources[file_name]['md5']:
+            return True
+
+    return False
+
+def fetch_report(erna_id, nodata_flag = False):
+    # report PDF of one teacher from the warm server, written to its file in report_dir (via a temporary file), returns the file name
+    url = '{}/report/{}.pdf{}'.format(server_url, urllib.quote(erna_id), '?nodata=1' if nodata_flag else '')
+    response = urllib2.urlopen(url, timeout = request_timeout)
+    file_name = response.info().getheader('X-Report-File')
+    content = response.read()
+    file_path = os.path.join(config['main_dir'], config['report_dir'], file_name)
+    if not os.path.isdir(os.path.dirname(file_path)):
+        os.makedirs(os.path.dirname(file_path))
+    with open(file_path + '.part', 'wb') as f_out:
+        f_out.write(content)
+    if os.path.isfile(file_path):
+        os.remove(file_path)
+    os.rename(file_path + '.part', file_path)
+
+    return file_name
+
+def run_warm(options):
+    # output the reports of options.teacher (default: all teachers in the input file) through the warm server, returns reports failed
+    # teachers without report data (404) are logged in missingfile, as in educ_eval_indiv_report_2018.py
+    status = server_status()
+    if status is None:
+        print 'starting warm report server'
+        start_server()
+    elif options.reload or sources_changed(status):
+        print 'reloading exports and input file in the warm report server'
+        urllib2.urlopen(urllib2.Request(server_url + '/reload', data = ''), timeout = start_timeout).read()
+    input_file = [line.split(';') for line in open(os.path.join(config['main_dir'], config['inputfile'])).read().splitlines()]
+    input_lines = dict((line[0], '; '.join(line)) for line in input_file)
+    teachers = options.teacher or [line[0] for line in input_file]
+    list_missing = []
+    count_failed = 0
+    for erna_id in teachers:
+        try:
+            print 'done: {} ({})'.format(erna_id, fetch_report(erna_id, options.nodata))
+        except urllib2.HTTPError as error:
+            if error.code == 404:
+                print 'missing: {}'.format(erna_id)
+                list_missing.append(input_lines.get(erna_id, erna_id))
+                continue
+            print 'failed: {} ({} {})'.format(erna_id, error.code, error.read())
+            count_failed += 1
+
+    # write simple log
+    with open(os.path.join(config['main_dir'], missingfile), 'w') as f_out:
+        for item in list_missing:
+            f_out.write(item + '\n')
+
+    return count_failed
+
+# main
+if __name__ == '__main__':
+    options, report_args = opt_parser.parse_known_args()
+    if options.warm:
+        if report_args:
+            opt_parser.error('only --teacher, --reload and --nodata can be used with --warm, not: {}'.format(' '.join(report_args)))
+        sys.exit(1 if run_warm(options) else 0)
+    if options.teacher or options.reload:
+        opt_parser.error('--teacher and --reload can only be used with --warm')
+    import educ_eval_indiv_report_2018 as report # report script, loads pandas and numpy
+    report.run(report_args + (['--nodata'] if options.nodata else []))
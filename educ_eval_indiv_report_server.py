@@ -0,0 +1,268 @@
+# HTTP server for single-teacher education evaluation reports on request, 2026_10_17
+# Pieter Vreeburg, E:vreeburg@ese.eur.nl
+
+# Loads and indexes the 2018 exports once at startup (with the data cache of educ_eval_indiv_report_2018.py) and renders the
+# report of one teacher per request, as HTML or PDF. PDF output runs in a bounded pool of worker threads (each waits on its own
+# wkhtmltopdf process) with a bounded queue, finished reports are kept in an LRU cache keyed by teacher, nodata flag, format and
+# data version. Dirs / files, template and pdfoptions are taken from educ_eval_indiv_report_2018.py.
+
+# Watch out for
+    # Python 2 has no asyncio, requests are handled by threads (ThreadingMixIn), rendering the HTML holds the GIL
+    # Only teachers in the input file can be requested (name and department are taken from the input file)
+    # New exports are picked up with POST /reload (or a restart), cached reports of the previous data version are not served again
+        # (educ_eval_indiv_report_cli.py --warm compares the source keys in /status with the files and reloads when they differ)
+    # The server has no authentication, bind it to localhost or a host only reachable by the department secretaries
+
+# requests
+    # GET /report/<erna-id>.pdf, GET /report/<erna-id>.html: report of one teacher, add ?nodata=1 for data cells represented as XXX
+        # (X-Report-File header: file name of the report in report_dir, as output by educ_eval_indiv_report_2018.py)
+    # GET /status: data version, keys of the source files (mtime, size and md5 hash), teachers, cache and queue counts (JSON)
+    # POST /reload: reload the exports and input file
+
+# cli options
+    # --host: address to listen on (default: host in [server] of the config file)
+    # --port: port to listen on (default: port in [server] of the config file)
+    # --workers N: number of PDFs output at the same time (default: 2)
+    # --queue N: number of PDF requests waiting for a worker, further requests get 503 (default: 20)
+    # --cache-size N: number of finished reports kept in memory (default: 100)
+    # --pdf-backend weasyprint: output PDF in-process with WeasyPrint instead of one wkhtmltopdf process per report
+
+# imports
+import os # os operations, from std. library
+import argparse # command line parsing, from std. library
+import json # status response and data version, from std. library
+import hashlib # data version, from std. library
+import re # request paths, from std. library
+import tempfile # temporary PDF file, from std. library
+import threading # locks and queue slots, from std. library
+import urlparse # request paths and query strings, from std. library
+import BaseHTTPServer # HTTP server, from std. library
+import SocketServer # one thread per request, from std. library
+from multiprocessing.pool import ThreadPool # bounded PDF worker pool, from std. library
+from collections import OrderedDict # LRU cache, from std. library
+
+import educ_eval_indiv_report_2018 as report # report script, data loading, template vars and PDF output
+import educ_eval_teacher_index # teacher to row offsets index, ERNA-id normalisation
+
+# set server options
+result_timeout = 300 # seconds a request waits for its PDF
+report_paths = re.compile(r'^/report/(\w+)\.(pdf|html)$')
+content_types = {'pdf' : 'application/pdf', 'html' : 'text/html; charset=utf-8'}
+
+# set up cli options parser
+opt_parser = argparse.ArgumentParser()
+opt_parser.add_argument('--host', help = 'Address to listen on (default: {})'.format(report.config['server_host']), default = report.config['server_host'])
+opt_parser.add_argument('--port', help = 'Port to listen on (default: {})'.format(report.config['server_port']), type = int, default = report.config['server_port'])
+opt_parser.add_argument('--workers', help = 'Number of PDFs output at the same time (default: 2)', type = int, default = 2)
+opt_parser.add_argument('--queue', help = 'Number of PDF requests waiting for a worker (default: 20)', type = int, default = 20)
+opt_parser.add_argument('--cache-size', help = 'Number of finished reports kept in memory (default: 100)', type = int, default = 100)
+opt_parser.add_argument('--pdf-backend', help = 'Engine used to output PDF (default: wkhtmltopdf)', choices = ['wkhtmltopdf', 'weasyprint'], default = 'wkhtmltopdf')
+
+# set server state (set up in main)
+report_data = {} # indexed exports and input file of the current data version, see load_report_data
+report_cache = OrderedDict() # LRU cache, (erna-id, nodata, format, data version): report content, most recently used last
+report_pending = {} # PDFs in the worker pool, (erna-id, nodata, format, data version): AsyncResult
+cache_counts = {'hits' : 0, 'misses' : 0, 'rejected' : 0}
+cache_lock = threading.Lock()
+reload_lock = threading.Lock()
+server_options = None
+pdf_pool = None
+queue_slots = None
+
+# functions
+def data_version(sources):
+    # hash of the script version and the md5 hashes of the source files (exports and input file)
+    return hashlib.md5(json.dumps([report.script_version, sorted((file_name, key['md5']) for file_name, key in sources.items())])).hexdigest()[:12]
+
+def load_report_data():
+    # load the exports (from the data cache if it is up to date), compute teacher statistics and index courses details and teacher stats
+    # the keys of the source files are taken before loading, a file changed while loading is picked up by the next staleness check
+    sources = dict((file_name, report.source_key(file_name)) for file_name in [report.teacherfile, report.openquestionfile, report.inputfile])
+    df_teacher_data, df_open_answers, courses_details = report.load_data_cached()
+    open_answers_index = report.group_open_answers(df_open_answers)
+    teacher_stats = report.teacher_statistics(courses_details)
+    courses_details, courses_offsets = educ_eval_teacher_index.teacher_index(courses_details)
+    teacher_stats, teacher_stats_offsets = educ_eval_teacher_index.teacher_index(teacher_stats)
+    input_file = [line.split(';') for line in open(os.path.join(report.main_dir, report.inputfile)).read().splitlines()]
+    input_erna = educ_eval_teacher_index.normalise_erna([teacher_erna_id for teacher_erna_id, pers_name, dept in input_file])
+
+    return {'version' : data_version(sources),
+            'sources' : sources,
+            'courses_details' : courses_details,
+            'courses_offsets' : courses_offsets,
+            'teacher_stats' : teacher_stats,
+            'teacher_stats_offsets' : teacher_stats_offsets,
+            'open_answers_index' : open_answers_index,
+            'teachers' : dict(zip(input_erna.tolist(), input_file))
+            }
+
+def render_html(data, erna_id, nodata_flag):
+    # render the report HTML of one teacher
+    teacher_erna_id, pers_name, dept = data['teachers'][erna_id]
+    courses_details_rep = educ_eval_teacher_index.teacher_rows(data['courses_details'], data['courses_offsets'], erna_id)
+    teacher_stats_rep = educ_eval_teacher_index.teacher_rows(data['teacher_stats'], data['teacher_stats_offsets'], erna_id)
+    template_vars = report.report_template_vars(teacher_erna_id, pers_name, courses_details_rep, data['open_answers_index'], nodata_flag, teacher_stats_rep,
+                                                data_version = data['version'])
+
+    return report.report_template().render(template_vars)
+
+def render_pdf(data, erna_id, nodata_flag, pdf_backend):
+    # render the report HTML of one teacher, output PDF to a temporary file and return its content, runs in the worker pool
+    # the queue slot of this request is released when the PDF is done
+    try:
+        html_out = render_html(data, erna_id, nodata_flag)
+        f_handle, pdf_path = tempfile.mkstemp(suffix = '.pdf')
+        os.close(f_handle)
+        try:
+            report.write_pdf(html_out, pdf_path, pdf_backend)
+            with open(pdf_path, 'rb') as f_in:
+                return f_in.read()
+        finally:
+            os.remove(pdf_path)
+    finally:
+        queue_slots.release()
+
+def drop_fragments(version):
+    # drop the open answers sections of other data versions from the fragment cache (keyed by data version, requests still running on
+    # the previous data version do not put their sections in the reports of the new version)
+    for fragment_key in report.fragment_cache.keys():
+        if fragment_key[-1] != version:
+            report.fragment_cache.pop(fragment_key, None)
+
+def cache_put(cache_key, content):
+    # add a finished report to the LRU cache, drop the least recently used reports above --cache-size
+    with cache_lock:
+        report_cache[cache_key] = content
+        report_pending.pop(cache_key, None)
+        while len(report_cache) > server_options.cache_size:
+            report_cache.popitem(last = False)
+
+def get_report(erna_id, nodata_flag, report_format):
+    # report content from the LRU cache, or rendered (and for PDF queued in the worker pool)
+    # returns (status, content), concurrent requests for the same report wait for the same PDF
+    data = report_data
+    if erna_id not in data['teachers'] or erna_id not in data['courses_offsets']:
+        return 404, 'No report data for teacher {}'.format(erna_id)
+    cache_key = (erna_id, nodata_flag, report_format, data['version'])
+    with cache_lock:
+        if cache_key in report_cache:
+            cache_counts['hits'] += 1
+            content = report_cache.pop(cache_key)
+            report_cache[cache_key] = content
+            return 200, content
+        cache_counts['misses'] += 1
+        pdf_result = report_pending.get(cache_key)
+        if pdf_result is None and report_format == 'pdf':
+            if not queue_slots.acquire(False):
+                cache_counts['rejected'] += 1
+                return 503, 'Too many reports in the queue, try again later'
+            pdf_result = pdf_pool.apply_async(render_pdf, (data, erna_id, nodata_flag, server_options.pdf_backend))
+            report_pending[cache_key] = pdf_result
+    if report_format == 'html':
+        content = render_html(data, erna_id, nodata_flag).encode('utf-8')
+    else:
+        try:
+            content = pdf_result.get(result_timeout)
+        except Exception:
+            with cache_lock:
+                if report_pending.get(cache_key) is pdf_result and pdf_result.ready():
+                    del report_pending[cache_key] # failed PDF, a new request tries again
+            raise
+    cache_put(cache_key, content)
+
+    return 200, content
+
+def report_file(erna_id, nodata_flag, report_format):
+    # file name of a report in report_dir, as output by educ_eval_indiv_report_2018.py (no folders are created, see report.report_name)
+    teacher_erna_id, pers_name, dept = report_data['teachers'][erna_id]
+
+    return report.report_name(teacher_erna_id, pers_name, dept, nodata_flag) + '.' + report_format
+
+def status():
+    # data version, keys of the source files, teachers, cache and queue counts
+    with cache_lock:
+        status_out = dict(cache_counts)
+        status_out.update({'data_version' : report_data['version'],
+                        'sources' : report_data['sources'],
+                        'teachers' : len(report_data['teachers']),
+                        'cached_reports' : len(report_cache),
+                        'pending_pdfs' : len(report_pending)
+                        })
+
+    return status_out
+
+class ReportServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True # do not wait for open requests on shutdown
+
+class ReportHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def send_content(self, status_code, content, content_type = 'text/plain; charset=utf-8', headers = None):
+        self.send_response(status_code)
+        self.send_header('Content-Type', content_type)
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        if url.path == '/status':
+            self.send_content(200, json.dumps(status(), indent = 4, sort_keys = True), 'application/json')
+            return
+        report_path = report_paths.match(url.path)
+        if not report_path:
+            self.send_content(404, 'Not found, use /report/<erna-id>.pdf or /report/<erna-id>.html')
+            return
+        try:
+            erna_id = educ_eval_teacher_index.normalise_erna([report_path.group(1)])[0]
+        except ValueError as error:
+            self.send_content(400, str(error))
+            return
+        nodata_flag = urlparse.parse_qs(url.query).get('nodata', ['0'])[0].lower() in ['1', 'true', 'yes']
+        report_format = report_path.group(2)
+        try:
+            status_code, content = get_report(erna_id, nodata_flag, report_format)
+            if status_code == 200:
+                headers = {'X-Report-File' : report_file(erna_id, nodata_flag, report_format)}
+        except Exception as error:
+            self.log_error('report %s failed: %r', erna_id, error)
+            self.send_content(500, 'Report failed: {!r}'.format(error))
+            return
+        if status_code == 200:
+            self.send_content(200, content, content_types[report_format], headers)
+        else:
+            self.send_content(status_code, content)
+
+    def do_POST(self):
+        global report_data
+        if urlparse.urlparse(self.path).path != '/reload':
+            self.send_content(404, 'Not found, use /reload')
+            return
+        with reload_lock:
+            report_data = load_report_data()
+            drop_fragments(report_data['version'])
+        self.send_content(200, json.dumps(status(), indent = 4, sort_keys = True), 'application/json')
+
+# main
+def main(options):
+    global server_options, pdf_pool, queue_slots, report_data
+    server_options = options
+    report.record_timings = False # stage timings of every request would be kept for as long as the server runs
+    pdf_pool = ThreadPool(options.workers)
+    queue_slots = threading.BoundedSemaphore(options.workers + options.queue)
+    report_data = load_report_data()
+    server = ReportServer((options.host, options.port), ReportHandler)
+    print 'serving reports for {} teachers (data version {}) on http://{}:{}/'.format(len(report_data['teachers']), report_data['version'], options.host, options.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pdf_pool.terminate()
+
+    print 'Done'
+
+if __name__ == '__main__':
+    options = opt_parser.parse_args()
+    main(options)
@@ -0,0 +1,111 @@
+# Output sinks for the education evaluation reports (local staging dir, ZIP archives), 2026_10_17
+# Pieter Vreeburg, E:vreeburg@ese.eur.nl
+
+# Reports are written to a local staging dir instead of report_dir on the network share. With --output staging the staging dir is
+# copied to report_dir in one pass at the end of the run, with --output zip each finished report is moved into a ZIP archive (one per
+# department for output_format 'stand_alone', else one per run) and only the archives are copied to report_dir.
+# Each archive has a MANIFEST.json entry (file: teacher, size, sha1). Used by educ_eval_indiv_report_2018.py (--output).
+
+# Watch out for
+    # With --incremental and --output zip unchanged reports are copied from the previous archive (not rendered or written again)
+    # Archives are written to a temporary file next to the target first, an interrupted copy does not leave a broken archive
+
+# imports
+import os # os operations, from std. library
+import shutil # copy to report_dir, from std. library
+import tempfile # staging dir, from std. library
+import hashlib # sha1 in the archive manifest, from std. library
+import json # archive manifest, from std. library
+import zipfile # ZIP archives, from std. library
+
+# set archive options
+run_archive = 'reports' # archive name if reports are not sorted into department subfolders
+manifest_entry = 'MANIFEST.json'
+stored_extensions = ['.pdf'] # already compressed, stored without compression, other files (HTML) are deflated
+
+# functions
+def staging_dir():
+    # new local staging dir
+    return tempfile.mkdtemp(prefix = 'educ_eval_reports_')
+
+def archive_location(file_name, nodata_flag = False):
+    # archive file name and name in the archive for a report file (relative path), the department subfolder becomes the archive
+    archive_dir, entry_name = os.path.split(file_name)
+    archive_file = (archive_dir or run_archive) + ('_NODATA' if nodata_flag else '') + '.zip'
+
+    return archive_file, entry_name
+
+def archive_entries(archive_path):
+    # names in an existing archive, empty if the archive does not exist
+    if not os.path.isfile(archive_path):
+        return set()
+    with zipfile.ZipFile(archive_path) as zip_in:
+        return set(zip_in.namelist()) - set([manifest_entry])
+
+def add_to_archive(archives, staging_path, file_name, teacher_erna_id, nodata_flag = False):
+    # move a report file from the staging dir into its archive
+    archive_file, entry_name = archive_location(file_name, nodata_flag)
+    zip_out, manifest = open_archive(archives, staging_path, archive_file)
+    file_path = os.path.join(staging_path, file_name)
+    with open(file_path, 'rb') as f_in:
+        content = f_in.read()
+    compress_type = zipfile.ZIP_STORED if os.path.splitext(file_name)[1] in stored_extensions else zipfile.ZIP_DEFLATED
+    zip_out.write(file_path, entry_name, compress_type)
+    manifest[entry_name] = {'teacher' : teacher_erna_id, 'size' : len(content), 'sha1' : hashlib.sha1(content).hexdigest()}
+    os.remove(file_path)
+
+def open_archive(archives, staging_path, archive_file):
+    # new archive in the staging dir (archives: {archive file: (ZipFile, manifest)}), opened on first use
+    if archive_file not in archives:
+        archives[archive_file] = (zipfile.ZipFile(os.path.join(staging_path, archive_file), 'w', zipfile.ZIP_DEFLATED, allowZip64 = True), {})
+
+    return archives[archive_file]
+
+def carry_over(archives, staging_path, target_path, file_names, nodata_flag = False):
+    # copy the entries of unchanged reports (not written in this run) from the previous archives in target_path, returns entries copied
+    entries_copied = 0
+    archive_names = {}
+    for file_name in file_names:
+        archive_file, entry_name = archive_location(file_name, nodata_flag)
+        archive_names.setdefault(archive_file, []).append(entry_name)
+    for archive_file, entry_names in archive_names.items():
+        if not os.path.isfile(os.path.join(target_path, archive_file)):
+            continue
+        zip_out, manifest = open_archive(archives, staging_path, archive_file)
+        with zipfile.ZipFile(os.path.join(target_path, archive_file)) as zip_in:
+            previous_names = set(zip_in.namelist())
+            previous_manifest = json.loads(zip_in.read(manifest_entry)) if manifest_entry in previous_names else {}
+            for entry_name in entry_names:
+                if entry_name not in previous_names or entry_name in manifest:
+                    continue
+                zip_info = zip_in.getinfo(entry_name)
+                zip_out.writestr(zip_info, zip_in.read(zip_info), zip_info.compress_type)
+                manifest[entry_name] = previous_manifest.get(entry_name, {})
+                entries_copied += 1
+
+    return entries_copied
+
+def close_archives(archives, staging_path, target_path):
+    # write the manifest into each archive and copy the archives to target_path (replacing the previous archives), returns archive files
+    for archive_file, (zip_out, manifest) in archives.items():
+        zip_out.writestr(manifest_entry, json.dumps(manifest, indent = 4, sort_keys = True))
+        zip_out.close()
+        shutil.copyfile(os.path.join(staging_path, archive_file), os.path.join(target_path, archive_file + '.part'))
+        if os.path.isfile(os.path.join(target_path, archive_file)):
+            os.remove(os.path.join(target_path, archive_file))
+        os.rename(os.path.join(target_path, archive_file + '.part'), os.path.join(target_path, archive_file))
+
+    return sorted(archives)
+
+def publish_staging(staging_path, target_path):
+    # copy all files in the staging dir to target_path in one pass (creating subfolders once), returns files copied
+    files_copied = 0
+    for dir_path, dir_names, file_names in os.walk(staging_path):
+        target_dir = os.path.join(target_path, os.path.relpath(dir_path, staging_path))
+        if not os.path.isdir(target_dir):
+            os.makedirs(target_dir)
+        for file_name in file_names:
+            shutil.copyfile(os.path.join(dir_path, file_name), os.path.join(target_dir, file_name))
+            files_copied += 1
+
+    return files_copied
@@ -0,0 +1,112 @@
+# Lexicon based sentiment and top terms for the open answers of the education evaluation reports, 2026_10_17
+# Pieter Vreeburg, E:vreeburg@ese.eur.nl
+
+# Scores every open answer with a small Dutch / English word lexicon (positive: +1, negative: -1, sign flipped after a negation,
+# eg 'niet duidelijk', 'not clear'). Sentiment of an answer: (positive - negative) / (positive + negative), 0 without lexicon words.
+# All answers are tokenised and scored in one batch (pandas string methods, NumPy group sums), no network or model files needed.
+# Scores and terms are cached per answer (md5 hash of the text), reruns only score new answers. The cache is rebuilt when the
+# lexicon changes. Used by educ_eval_indiv_report_2018.py (--sentiment).
+
+# Watch out for
+    # A lexicon only gives an indication: sarcasm, suggestions ('more examples') and mixed answers are not scored correctly
+    # Sentiment of a course: mean over the answers with lexicon words, answers without lexicon words are only counted in 'answers'
+
+# imports
+import os # os operations, from std. library
+import json # score cache, from std. library
+import re # tokenising, from std. library
+import hashlib # answer hashes and lexicon version, from std. library
+from collections import Counter # top terms, from std. library
+
+import pandas as pd # dataframes functionality
+import numpy as np # group sums
+
+# set lexicon and term options
+positive_words = set(u'''goed goede beter best beste prima uitstekend uitstekende duidelijk duidelijke helder heldere fijn fijne leuk leuke
+    interessant interessante nuttig nuttige handig handige behulpzaam behulpzame enthousiast enthousiaste waardevol waardevolle relevant
+    relevante gestructureerd begrijpelijk begrijpelijke sterk sterke top super geweldig geweldige boeiend boeiende leerzaam leerzame
+    praktisch praktische overzichtelijk overzichtelijke gewaardeerd waardeer
+    good great better best excellent clear clearly helpful interesting nice useful enthusiastic engaging enjoyed enjoy liked like love
+    loved relevant structured organised organized insightful amazing fantastic perfect perfectly motivated motivating motivational
+    inspiring informative practical appreciated appreciate well extraordinary valuable fun awesome'''.split())
+negative_words = set(u'''slecht slechte slechter onduidelijk onduidelijke vaag vage saai saaie lastig lastige chaotisch chaotische rommelig
+    rommelige verwarrend verwarrende jammer teleurstellend teleurstellende matig matige zwak zwakke slordig slordige onvoldoende onhandig
+    onhandige irritant irritante traag trage moeilijk moeilijke onnodig onnodige onoverzichtelijk onoverzichtelijke ontbreekt missen
+    bad worse worst poor poorly unclear vague boring bored confusing confused chaotic messy disorganized disorganised disappointing
+    disappointed weak annoying useless unhelpful unnecessary difficult hard rushed slow terrible horrible lacking missing unfair
+    frustrating'''.split())
+negation_words = set(u'niet geen nooit not no never nothing hardly'.split())
+stop_words = set(u'''de het een en of maar dat die dit deze er is zijn was waren wordt worden werd heb hebben had je jij u ik we wij ze zij
+    hij hem haar het van voor met op aan in uit bij naar om over door tot als dan ook nog wel niet geen meer veel heel erg zeer
+    te zo al nu wat wie waar hoe kan kunnen zou zouden moet moeten mag mij me mijn ons onze jullie hun men iets alles echt vak
+    the a an and or but that this these those there is are was were be been being have has had i you he she it we they me my
+    our your their his her its of for with on at in out by to from as than then also still more much very so too what who
+    where how can could would should must may will do does did not no just really some any all about which when because into only
+    other lot during omdat soms beetje andere alle \xe9\xe9n course lectures lecture lecturer teacher subject'''.split())
+token_pattern = r'[^\W\d_]+' # words of letters only (unicode)
+min_term_length = 3
+top_terms_count = 5
+lexicon_version = hashlib.md5(json.dumps([sorted(positive_words), sorted(negative_words), sorted(negation_words), sorted(stop_words),
+                                        token_pattern, min_term_length])).hexdigest()
+
+# functions
+def answer_hash(answer):
+    return hashlib.md5(answer.encode('utf-8')).hexdigest()
+
+def score_answers(answers):
+    # sentiment and content terms (tokens minus stop words) of each answer, answers: list of unicode, one batch
+    tokens = pd.Series(answers).str.lower().str.findall(token_pattern, flags = re.UNICODE)
+    token_counts = tokens.map(len).values
+    if not token_counts.sum():
+        return [(0.0, 0, []) for answer in answers]
+    answer_ids = np.repeat(np.arange(len(answers)), token_counts)
+    flat_tokens = pd.Series(np.concatenate(tokens.values))
+    polarity = flat_tokens.isin(positive_words).values.astype(int) - flat_tokens.isin(negative_words).values.astype(int)
+    # negation: flip the sign of a lexicon word directly after a negation word in the same answer
+    is_negated = np.r_[False, flat_tokens.isin(negation_words).values[:-1] & (answer_ids[1:] == answer_ids[:-1])]
+    polarity[is_negated] *= -1
+    positive = np.bincount(answer_ids, weights = polarity > 0, minlength = len(answers))
+    negative = np.bincount(answer_ids, weights = polarity < 0, minlength = len(answers))
+    sentiment = (positive - negative) / np.maximum(positive + negative, 1)
+    is_term = (~flat_tokens.isin(stop_words) & (flat_tokens.str.len() >= min_term_length)).values
+    answer_terms = np.split(flat_tokens.values, np.cumsum(token_counts)[:-1])
+    term_mask = np.split(is_term, np.cumsum(token_counts)[:-1])
+
+    return [(float(answer_sentiment), int(lexicon_words), terms[mask].tolist()) for answer_sentiment, lexicon_words, terms, mask in
+            zip(sentiment, positive + negative, answer_terms, term_mask)]
+
+def load_score_cache(cache_file):
+    # cached scores {answer hash: [sentiment, lexicon words, terms]}, empty if the file is missing or the lexicon changed
+    if os.path.isfile(cache_file):
+        with open(cache_file) as f_in:
+            score_cache = json.load(f_in)
+        if score_cache.get('lexicon_version') == lexicon_version:
+            return score_cache['scores']
+
+    return {}
+
+def course_summaries(df_open_answers, cache_file = None):
+    # answers, mean sentiment, share of positive / negative answers and top terms per course (index of df_open_answers: course_code)
+    # scores of answers not in cache_file are computed in one batch and added to cache_file
+    answers = df_open_answers['resp_value'].dropna().astype(unicode)
+    answer_hashes = answers.map(answer_hash)
+    score_cache = load_score_cache(cache_file) if cache_file else {}
+    is_new = ~answer_hashes.isin(score_cache).values & ~answer_hashes.duplicated().values
+    if is_new.any():
+        score_cache.update(zip(answer_hashes.values[is_new], score_answers(list(answers.values[is_new]))))
+        if cache_file:
+            with open(cache_file, 'w') as f_out:
+                json.dump({'lexicon_version' : lexicon_version, 'scores' : score_cache}, f_out)
+    summaries = {}
+    for course_code, course_hashes in answer_hashes.groupby(level = 0):
+        scores = [score_cache[hash_value] for hash_value in course_hashes.values]
+        scored = [answer_sentiment for answer_sentiment, lexicon_words, terms in scores if lexicon_words]
+        term_counts = Counter(term for answer_sentiment, lexicon_words, terms in scores for term in set(terms))
+        summaries[course_code] = {'answers' : len(scores),
+                                'sentiment' : round(np.mean(scored), 2) if scored else None,
+                                'positive' : sum(answer_sentiment > 0 for answer_sentiment in scored) / float(len(scores)),
+                                'negative' : sum(answer_sentiment < 0 for answer_sentiment in scored) / float(len(scores)),
+                                'top_terms' : [term for term, count in term_counts.most_common(top_terms_count)]
+                                }
+
+    return summaries
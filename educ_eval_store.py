@@ -0,0 +1,91 @@
+# Partitioned multi-year data store for the education evaluation reports, 2026_10_17
+# Pieter Vreeburg, E:vreeburg@ese.eur.nl
+
+# The courses details (teacher scores per course and item, as cleaned and melted by educ_eval_indiv_report_2018.py) of each year are
+# stored as one Parquet file per year: <store>/course_year=<year>/courses_details.parquet, sorted by teacher in small row groups.
+# read_store only opens the partitions of the requested years and only reads the requested columns of the row groups whose teacher
+# min / max statistics can contain one of the requested teachers, so a history report does not load every year's full export.
+# Used by educ_eval_indiv_report_2018.py (--ingest YEAR, --history).
+
+# Watch out for
+    # Requires pyarrow
+    # Ingesting a year again replaces the partition of that year
+    # Only exports in the 2018 format can be ingested (teacher_erna, course_code, course_name, educ_form, resp_count, item, score)
+
+# imports
+import os # os operations, from std. library
+import re # partition dir names, from std. library
+
+import pandas as pd # dataframes functionality
+import numpy as np # row group selection
+
+# set store layout
+partition_dirs = re.compile(r'^course_year=(\d+)$')
+partition_file = 'courses_details.parquet'
+store_columns = ['teacher_erna', 'course_code', 'course_name', 'educ_form', 'resp_count', 'item', 'score']
+row_group_size = 2000 # rows per row group, smaller row groups skip more rows when reading few teachers
+
+# functions
+def store_years(store_path):
+    # years in the store, ascending
+    if not os.path.isdir(store_path):
+        return []
+
+    return sorted(int(partition_dirs.match(dir_name).group(1)) for dir_name in os.listdir(store_path) if partition_dirs.match(dir_name))
+
+def write_partition(courses_details, year, store_path):
+    # write the courses details of one year as its partition (replaces the partition if the year is already in the store)
+    import pyarrow as pa # Arrow tables, only needed for the store
+    import pyarrow.parquet as pq # Parquet files, only needed for the store
+    partition_out = courses_details.reset_index()[store_columns]
+    for column in ['course_code', 'course_name', 'educ_form', 'resp_count', 'item']:
+        partition_out[column] = partition_out[column].astype(unicode) # resp_count can be a range (eg 15-17)
+    partition_out['teacher_erna'] = partition_out['teacher_erna'].astype(np.int64)
+    partition_out['score'] = pd.to_numeric(partition_out['score'], errors = 'coerce')
+    partition_out = partition_out.sort_values('teacher_erna', kind = 'mergesort')
+    partition_path = os.path.join(store_path, 'course_year={}'.format(year))
+    if not os.path.isdir(partition_path):
+        os.makedirs(partition_path)
+    # write to a temporary file first, an interrupted ingest does not leave a broken partition
+    file_path = os.path.join(partition_path, partition_file)
+    pq.write_table(pa.Table.from_pandas(partition_out, preserve_index = False), file_path + '.part', row_group_size = row_group_size)
+    if os.path.isfile(file_path):
+        os.remove(file_path)
+    os.rename(file_path + '.part', file_path)
+
+    return len(partition_out)
+
+def read_store(store_path, erna_ids = None, years = None, columns = None):
+    # courses details of the requested teachers (SAP-ids) and years (default: all), only the requested columns (teacher_erna and
+    # course_year are always included), row groups without any of the requested teachers are not read
+    import pyarrow.parquet as pq # Parquet files, only needed for the store
+    columns = [column for column in (columns or store_columns) if column != 'teacher_erna']
+    if erna_ids is not None:
+        erna_ids = np.unique(np.asarray(erna_ids, dtype = np.int64))
+    frames = []
+    for year in store_years(store_path):
+        if years and year not in years:
+            continue
+        parquet_file = pq.ParquetFile(os.path.join(store_path, 'course_year={}'.format(year), partition_file))
+        row_groups = range(parquet_file.num_row_groups)
+        if erna_ids is not None:
+            erna_column = parquet_file.schema.names.index('teacher_erna')
+            row_groups_out = []
+            for row_group in row_groups:
+                statistics = parquet_file.metadata.row_group(row_group).column(erna_column).statistics
+                # first requested teacher >= min of the row group, is it <= max?
+                first_id = np.searchsorted(erna_ids, statistics.min)
+                if first_id < len(erna_ids) and erna_ids[first_id] <= statistics.max:
+                    row_groups_out.append(row_group)
+            row_groups = row_groups_out
+        if not row_groups:
+            continue
+        frame = parquet_file.read_row_groups(row_groups, columns = ['teacher_erna'] + columns).to_pandas()
+        if erna_ids is not None:
+            frame = frame.loc[np.in1d(frame['teacher_erna'].values, erna_ids)]
+        frame.insert(1, 'course_year', year)
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns = ['teacher_erna', 'course_year'] + columns)
+
+    return pd.concat(frames, ignore_index = True)
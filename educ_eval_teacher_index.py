@@ -0,0 +1,56 @@
+# Teacher index for the education evaluation reports, 2026_10_17
+# Pieter Vreeburg, E:vreeburg@ese.eur.nl
+
+# Maps each teacher (SAP-id) to a contiguous block of rows (start, stop) in a frame sorted by teacher, so the rows of one teacher
+# are taken with a positional slice (no copy of the data, no scan of the whole frame) instead of .xs() / boolean masks.
+# Used by educ_eval_indiv_report.py (2017) and educ_eval_indiv_report_2018.py.
+
+# Watch out for
+    # The available data is not consistent with regards to ERNA-ids. Sometimes only SAP-id is used (eg 6610),
+        # sometimes the full ERNA-id is used (eg 06610pfr), normalise_erna reduces both to the SAP-id (6610)
+    # The frame is sorted with a stable sort, the order of the rows within a teacher is kept
+
+# imports
+import pandas as pd # dataframes functionality
+import numpy as np # sorting, block offsets and set difference
+
+# functions
+def normalise_erna(erna_in):
+    # SAP-id (int) for a Series of full ERNA-ids ('06610pfr') and / or SAP-ids (6610, '06610', 6610.0)
+    erna_digits = pd.Series(erna_in).astype(unicode).str.strip().str.extract(r'^(\d+)', expand = False)
+    if erna_digits.isnull().any():
+        raise ValueError('ERNA-id without SAP-id: {}'.format(', '.join(pd.Series(erna_in)[erna_digits.isnull().values].astype(unicode).unique())))
+
+    return erna_digits.astype(int).values
+
+def teacher_index(frame_in, erna_column = None):
+    # sort frame_in by teacher (SAP-id in column erna_column or in the (first level of the) index), returns the sorted frame and
+    # a dict {teacher: (start, stop)} with the row offsets of each teacher in the sorted frame
+    if erna_column is None:
+        erna_values = frame_in.index.get_level_values(0).values
+    else:
+        erna_values = frame_in[erna_column].values
+    erna_values = erna_values.astype(int)
+    if len(erna_values) and not (erna_values[1:] >= erna_values[:-1]).all():
+        order = np.argsort(erna_values, kind = 'mergesort')
+        frame_in = frame_in.iloc[order]
+        erna_values = erna_values[order]
+    starts = np.flatnonzero(np.r_[True, erna_values[1:] != erna_values[:-1]]) if len(erna_values) else np.array([], dtype = int)
+    stops = np.r_[starts[1:], len(erna_values)]
+    teacher_offsets = dict(zip(erna_values[starts].tolist(), zip(starts.tolist(), stops.tolist())))
+
+    return frame_in, teacher_offsets
+
+def teacher_rows(frame_in, teacher_offsets, erna_id, drop_level = False):
+    # rows of one teacher (a view on frame_in, no rows for a teacher not in the index), with drop_level the teacher level
+    # of a MultiIndex is dropped (as .xs(erna_id, level = 0))
+    start, stop = teacher_offsets.get(erna_id, (0, 0))
+    rows_out = frame_in.iloc[start:stop]
+    if drop_level:
+        rows_out.index = rows_out.index.droplevel(0)
+
+    return rows_out
+
+def missing_teachers(erna_ids, teacher_offsets):
+    # boolean array, True for the SAP-ids in erna_ids (eg from the input file) that are not in the index
+    return ~np.in1d(np.asarray(erna_ids, dtype = int), np.fromiter(teacher_offsets.keys(), dtype = int, count = len(teacher_offsets)))